@@ -0,0 +1,195 @@
+import math
+
+import numpy as np
+
+# ==================== This file contains mergeable online accumulators for statistics
+
+DIGEST_COMPRESSION = 200  # t-digest compression (higher is more accurate, uses more centroids)
+DIGEST_BUFFER = 500  # number of values buffered before compressing the t-digest
+
+
+class TDigest:
+    """
+    Merging t-digest for estimating percentiles of a stream of values
+    (see Dunning & Ertl, "Computing extremely accurate quantiles using t-digests").
+    Small sets of values are represented exactly. Digests can be merged.
+    """
+
+    def __init__(self, compression: float = DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self) -> int:
+        return int(self.weights.sum()) + len(self.buffer)
+
+    def add(self, values):
+        """
+        Adds the given value(s) to the digest.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        if len(values) <= 0:
+            return
+        self.min, self.max = min(self.min, float(values.min())), max(self.max, float(values.max()))
+        self.buffer.extend(values.tolist())
+        if len(self.buffer) >= DIGEST_BUFFER:
+            self.compress()
+
+    def merge(self, other: "TDigest"):
+        """
+        Merges the given digest into this one.
+        """
+        other.compress()
+        self.compress()
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def compress(self, means: np.ndarray = None, weights: np.ndarray = None):
+        """
+        Merges the buffered values into the centroids of the digest.
+        """
+        if means is None:
+            if len(self.buffer) <= 0:
+                return
+            means = np.concatenate([self.means, self.buffer])
+            weights = np.concatenate([self.weights, np.ones(len(self.buffer))])
+        self.buffer = []
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Merge neighboring centroids as long as they span at most one unit of the scale function
+        # k(q) = compression / (2 * pi) * asin(2q - 1)
+        merged_means, merged_weights = [], []
+        cumulative, k_lower = 0.0, self.scale(0.0)
+        for mean, weight in zip(means.tolist(), weights.tolist(), strict=True):
+            if merged_weights and self.scale((cumulative + weight) / total) - k_lower <= 1:
+                merged_weights[-1] += weight
+                merged_means[-1] += (mean - merged_means[-1]) * weight / merged_weights[-1]
+            else:
+                if merged_weights:
+                    k_lower = self.scale(cumulative / total)
+                merged_means.append(mean)
+                merged_weights.append(weight)
+            cumulative += weight
+        self.means, self.weights = np.array(merged_means), np.array(merged_weights)
+
+    def scale(self, q: float) -> float:
+        """
+        Scale function of the digest (limits centroid sizes near the tails).
+        """
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the given quantile (0 <= q <= 1). Values are interpolated linearly
+        between the centroids (matching numpy's default, if all centroids are single values).
+        """
+        self.compress()
+        if len(self.weights) <= 0:
+            return 0.0
+        # Rank of the center of each centroid
+        ranks = np.cumsum(self.weights) - (self.weights + 1) / 2
+        target = q * (self.weights.sum() - 1)
+        return float(np.interp(target, ranks, self.means, left=self.min, right=self.max))
+
+
+class Summary:
+    """
+    Online summary (count, min, max, total, mean, variance and percentiles) of a
+    stream of values. Summaries can be merged, e.g., when computed for shards.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.digest = TDigest()
+
+    def add(self, values):
+        """
+        Adds the given value(s) to the summary.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        if len(values) <= 0:
+            return
+        for value in values.tolist():
+            self.total += value
+        batch = Summary()
+        batch.count = len(values)
+        batch.min, batch.max = float(values.min()), float(values.max())
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        self.combine(batch)
+        self.digest.add(values)
+
+    def merge(self, other: "Summary"):
+        """
+        Merges the given summary into this one.
+        """
+        self.total += other.total
+        self.combine(other)
+        self.digest.merge(other.digest)
+
+    def combine(self, other: "Summary"):
+        """
+        Combines count, min, max, mean and variance of the given summary into this one
+        (see Chan et al., "Updating formulae and a pairwise algorithm for computing sample variances").
+        """
+        if other.count <= 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+    @property
+    def avg(self) -> float:
+        return self.total / float(self.count) if self.count > 0 else 0.0
+
+    @property
+    def variance(self) -> float:
+        """
+        Returns the (population) variance of the values.
+        """
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the (estimated) given percentile (0 <= p <= 100) of the values.
+        """
+        return self.digest.quantile(p / 100.0)
+
+
+class Summaries:
+    """
+    Named summaries (see Summary) that are filled and merged together, e.g., the
+    metrics of the groups of one shard (see parallel.reduce_groups).
+    """
+
+    def __init__(self, *names: str):
+        self.summaries = {name: Summary() for name in names}
+
+    def __getitem__(self, name: str) -> Summary:
+        return self.summaries[name]
+
+    def add(self, **values):
+        """
+        Adds the given value(s) to the summaries of the same name.
+        """
+        for name, value in values.items():
+            self.summaries[name].add(value)
+
+    def merge(self, other: "Summaries"):
+        """
+        Merges the given summaries into these ones.
+        """
+        for name, summary in other.summaries.items():
+            self.summaries[name].merge(summary)
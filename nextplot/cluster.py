@@ -1,5 +1,4 @@
 import json
-from collections.abc import Callable
 
 import folium
 import numpy as np
@@ -7,11 +6,22 @@ import plotly.graph_objects as go
 import scipy.spatial
 from folium import plugins
 
-from . import common, types
+from . import accumulators, common, jsonstream, parallel, raster, types
 
 # ==================== This file contains cluster plotting code (mode: 'cluster')
 
 
+COLOR_MISASSIGNED = common.get_color(0, 1, 1)
+NEAREST_TOLERANCE = 1e-6  # relative slack for which nearest centroids are confirmed using the original measure
+HULL_BATCH_MAX = 128  # max. cluster size for which hulls are calculated in a batch (larger ones use Qhull)
+CLUSTER_METRICS = (
+    "size",
+    "diameter",
+    "distance_sum",
+    "distance_max",
+    "wcss",
+)  # metrics per cluster (see cluster_metrics)
+
 # ==================== Cluster mode argument definition
 
 
@@ -66,20 +76,161 @@ def arguments(parser):
 # ==================== Cluster plotting specific functionality
 
 
-def convex_hull(points):
+def convex_hulls(groups: list[np.ndarray]) -> list[list[tuple[float, float]]]:
     """
-    Calculates the convex hull for the given points and
-    returns it as a sorted list of points.
+    Calculates the convex hulls (counterclockwise) for all given (n, 2) coordinate
+    arrays at once. Groups of up to HULL_BATCH_MAX points are processed together by a
+    vectorized monotone chain, larger ones by Qhull. Degenerate groups (duplicate or
+    collinear points), which Qhull rejects, are added to the batch and result in their
+    extreme points.
     """
+    hulls = [None] * len(groups)
+    batch = []
+    for i, coords in enumerate(groups):
+        if len(coords) <= 2:
+            hulls[i] = list(map(tuple, np.asarray(coords).tolist()))
+        elif len(coords) <= HULL_BATCH_MAX:
+            batch.append(i)
+        else:
+            try:
+                hull = scipy.spatial.ConvexHull(coords)
+                hulls[i] = list(map(tuple, coords[hull.vertices].tolist()))
+            except (scipy.spatial.QhullError, ValueError):
+                batch.append(i)
+    if len(batch) <= 0:
+        return hulls
+
+    # Sort groups by size (descending), such that the groups still active at a step form a prefix
+    batch = sorted(batch, key=lambda i: -len(groups[i]))
+    sizes = np.array([len(groups[i]) for i in batch])
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    coords = np.concatenate([np.asarray(groups[i]) for i in batch])
+    owners = np.repeat(np.arange(len(batch)), sizes)
+    # Sort points of each group lexicographically and arrange them as (groups, max. size) array
+    order = np.lexsort((coords[:, 1], coords[:, 0], owners))
+    coords = coords[order]
+    ranks = np.arange(len(coords)) - offsets[owners]
+    points = np.zeros((len(batch), sizes[0], 2), dtype=coords.dtype)
+    points[owners, ranks] = coords
+    # Skip duplicate points
+    valid = np.zeros((len(batch), sizes[0]), dtype=bool)
+    valid[owners, ranks] = np.concatenate([[True], np.any(coords[1:] != coords[:-1], axis=1) | (ranks[1:] == 0)])
+    # Build lower and upper hull chains (the latter on the reversed point order)
+    reverse = np.clip(sizes[:, None] - 1 - np.arange(sizes[0])[None, :], 0, None)
+    rows = np.arange(len(batch))[:, None]
+    lower, lower_sizes = monotone_chains(points, valid, sizes)
+    upper, upper_sizes = monotone_chains(points[rows, reverse], valid[rows, reverse], sizes)
+    for g, i in enumerate(batch):
+        if lower_sizes[g] <= 1:  # All points are identical
+            hulls[i] = [tuple(lower[g, 0].tolist())]
+            continue
+        hull = np.concatenate([lower[g, : lower_sizes[g] - 1], upper[g, : upper_sizes[g] - 1]])
+        hulls[i] = list(map(tuple, hull.tolist()))
+    return hulls
+
 
-    if len(points) <= 2:
-        return [(p.lon, p.lat) for p in points]
+def monotone_chains(points: np.ndarray, valid: np.ndarray, sizes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the monotone chains (Andrew's algorithm) of all groups in lockstep. points is a
+    (groups, max. size, 2) array of sorted points, valid masks the points to consider and
+    sizes (descending) gives the number of points per group. Returns the chains as
+    (groups, max. size, 2) array along with their lengths.
+    """
+    chains = np.zeros_like(points)
+    lengths = np.zeros(len(points), dtype=np.int64)
+    for k in range(points.shape[1]):
+        active = np.flatnonzero(valid[: np.searchsorted(-sizes, -k, side="left"), k])
+        q = points[active, k]
+        # Pop points not making a counterclockwise turn
+        candidates = active
+        while len(candidates) > 0:
+            candidates = candidates[lengths[candidates] >= 2]
+            o = chains[candidates, lengths[candidates] - 2]
+            a = chains[candidates, lengths[candidates] - 1]
+            b = points[candidates, k]
+            cross = (a[:, 0] - o[:, 0]) * (b[:, 1] - o[:, 1]) - (a[:, 1] - o[:, 1]) * (b[:, 0] - o[:, 0])
+            candidates = candidates[cross <= 0]
+            lengths[candidates] -= 1
+        chains[active, lengths[active]] = q
+        lengths[active] += 1
+    return chains, lengths
+
+
+def cluster_centroid(coords: np.ndarray) -> tuple[float, float] | None:
+    """
+    Returns the centroid of the given (n, 2) cluster coordinates (None, if empty).
+    """
+    if len(coords) <= 0:
+        return None
+    # Sum up sequentially (cumsum) to get the same centroid as summing up point by point
+    return tuple((np.cumsum(coords, axis=0, dtype=np.float64)[-1] / len(coords)).tolist())
 
-    np_points = np.array([(p.lon, p.lat) for p in points])
-    hull = scipy.spatial.ConvexHull(np_points)
-    simplices = hull.vertices.tolist()
 
-    return [(points[s].lon, points[s].lat) for s in simplices]
+def cluster_metrics(coords: np.ndarray, hull: np.ndarray, metrics: accumulators.Summaries, world_coords: bool) -> tuple:
+    """
+    Calculates diameter and centroid for the given (n, 2) cluster coordinates and hull.
+    Size, diameter and the sum, max and sum of squares of the distances from the
+    centroid are fed into the given metrics (see CLUSTER_METRICS).
+    """
+    one_to_many = common.haversine_one_to_many if world_coords else common.euclidean_one_to_many
+    diameter = common.diameter(coords, world_coords, hull)
+    centroid = cluster_centroid(coords)
+    distances_from_centroid = np.empty(0)
+    if centroid is not None:
+        distances_from_centroid = one_to_many(centroid, coords)
+    metrics.add(
+        size=len(coords),
+        diameter=diameter,
+        distance_sum=float(distances_from_centroid.sum()),
+        distance_max=float(distances_from_centroid.max(initial=0)),
+        wcss=float((distances_from_centroid**2).sum()),
+    )
+    return diameter, centroid
+
+
+def nearest_centroids(clusters: list[types.Cluster], world_coords: bool):
+    """
+    Determines for all points whether they are closer to the centroid of
+    another cluster than to the one of their own (using a KD-tree on the
+    unit sphere for world coordinates, in the plane otherwise). Near-ties are
+    confirmed using the original measure. The index of the cluster a point
+    should be reassigned to is stored in cluster.reassignments (-1 if none).
+    Returns the number of points to be reassigned.
+    """
+    measure = common.haversine if world_coords else common.euclidean
+    embed = common.unit_sphere if world_coords else (lambda c: np.asarray(c, dtype=np.float64))
+    # Collect centroids and points (with the index of their own centroid)
+    indices = [i for i, c in enumerate(clusters) if hasattr(c, "centroid")]
+    for cluster in clusters:
+        cluster.reassignments = np.full(cluster.size, -1)
+    if len(indices) <= 0:
+        return 0
+    centroids = np.array([clusters[i].centroid for i in indices], dtype=np.float64)
+    owners = np.concatenate([np.full(clusters[i].size, c) for c, i in enumerate(indices)])
+    points = np.concatenate([clusters[i].coords for i in indices])
+    # Query nearest centroids
+    tree = scipy.spatial.cKDTree(embed(centroids))
+    embedded = embed(points)
+    own = np.linalg.norm(embedded - tree.data[owners], axis=1)
+    nearest_distance, nearest = tree.query(embedded)
+    targets = np.where(nearest_distance < own * (1 - NEAREST_TOLERANCE), nearest, -1)
+    # Confirm near-ties (other centroids at about the same distance) using the original measure
+    undecided = np.nonzero(targets < 0)[0]
+    radii = own[undecided] * (1 + NEAREST_TOLERANCE)
+    counts = tree.query_ball_point(embedded[undecided], radii, return_length=True)
+    for p in undecided[counts > 1].tolist():
+        point, owner = points[p].tolist(), owners[p]
+        own_distance = measure(centroids[owner].tolist(), point)
+        for c in tree.query_ball_point(embedded[p], own[p] * (1 + NEAREST_TOLERANCE)):
+            distance = measure(centroids[c].tolist(), point)
+            if distance < own_distance:
+                own_distance, targets[p] = distance, c
+    # Store reassignment targets per cluster (as cluster indices)
+    targets = np.where(targets >= 0, np.array(indices)[targets], -1)
+    offsets = np.cumsum([0] + [clusters[i].size for i in indices])
+    for c, i in enumerate(indices):
+        clusters[i].reassignments = targets[offsets[c] : offsets[c + 1]]
+    return int((targets >= 0).sum())
 
 
 def parse(
@@ -89,12 +240,18 @@ def parse(
     jpath_pos: str,
     jpath_x: str,
     jpath_y: str,
-) -> tuple[list[list[types.Position]], list[list[types.Position]]]:
+    keep_desc: bool = True,
+    stream: bool = False,
+    float32: bool = False,
+) -> types.PositionArray:
     """
     Parses the cluster data from the file(s).
     """
     # Load json data
-    content_cluster, content_points = common.load_data(input_cluster, input_pos)
+    if stream:
+        content_cluster, content_points = jsonstream.load_data(input_cluster, [jpath_cluster], input_pos, [jpath_pos])
+    else:
+        content_cluster, content_points = common.load_data(input_cluster, input_pos)
 
     # Extract clusters
     points = common.extract_position_groups(
@@ -104,6 +261,8 @@ def parse(
         jpath_pos,
         jpath_x,
         jpath_y,
+        keep_desc,
+        np.float32 if float32 else np.float64,
     )
 
     return points
@@ -128,13 +287,29 @@ def plot(
     weight_points: float,
     custom_map_tile: list[str],
     plotly_theme: str,
+    no_desc: bool = False,
+    stream: bool = False,
+    verbose: bool = False,
+    float32: bool = False,
+    workers: int = 1,
+    plot_consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+    plotly_js: str = common.PLOTLY_JS_INLINE,
+    image_backend: types.ImageBackend = types.ImageBackend.kaleido,
+    outputs: list[str] = common.OUTPUTS,
 ):
     """
     Plots clusters based on the given arguments.
     Interprets args, reads .json, collects some stats,
     plots a .png and plots an interactive .html map.
+    Only the given outputs are produced, skipping all stages they do not need.
     """
 
+    # Determine the stages needed for the requested outputs
+    stages = common.required_stages(outputs, image_backend)
+    if common.STAGE_PARSE not in stages:
+        return
+
     # Determine base filename
     base_name = "plot"  # Default for STDIN
     if input_cluster:
@@ -148,7 +323,13 @@ def plot(
         jpath_pos,
         jpath_x,
         jpath_y,
+        not no_desc,
+        stream,
+        float32,
     )
+    if verbose:
+        common.print_jpath_cache_info()
+        common.print_document_info()
 
     # Quit on no points
     if len(points) <= 0:
@@ -162,60 +343,159 @@ def plot(
         return
 
     # Determine bbox
-    bbox = common.bounding_box(points)
+    bbox = common.bounding_box([points])
 
     # Wrap in clusters
-    clusters = [types.Cluster(p) for p in points]  # Wrap it
+    clusters = points.wrap(types.Cluster)  # Wrap it
     if len(clusters) <= 0:
         print(f"no clusters could be extracted at the given path: {jpath_cluster}")
         return
 
-    measure = common.haversine if world_coords else common.euclidean
+    # Determine cluster hulls
+    if common.STAGE_HULLS in stages:
+        hulls = convex_hulls([c.coords for c in clusters])
+        for cluster, hull in zip(clusters, hulls, strict=True):
+            cluster.hull = hull
+            cluster.size = len(cluster.coords)
 
     # Process clusters
-    for cluster in clusters:
-        # Collect some statistics of the cluster
-        cluster.size = len(cluster.points)
-        cluster.diameter = 0
-        if len(cluster.points) > 0:
-            centroid_x = sum([p.lon for p in cluster.points]) / len(cluster.points)
-            centroid_y = sum([p.lat for p in cluster.points]) / len(cluster.points)
-            cluster.centroid = (centroid_x, centroid_y)
-
-        distances_from_centroid = [measure(p, cluster.centroid) for p in cluster.points]
-        cluster.sum_of_distances_from_centroid = sum(distances_from_centroid)
-        cluster.max_distance_from_centroid = max(distances_from_centroid, default=0)
-        cluster.wcss = sum([measure(p, cluster.centroid) ** 2 for p in cluster.points])
-
-        for i in range(len(cluster.points)):
-            for j in range(len(cluster.points)):
-                if i == j:
-                    continue
-                distance = measure(
-                    cluster.points[i],
-                    cluster.points[j],
-                )
-                if distance > cluster.diameter:
-                    cluster.diameter = distance
+    metrics, bad_assignments = accumulators.Summaries(*CLUSTER_METRICS), 0
+    if common.STAGE_METRICS in stages:
+        results, metrics = parallel.reduce_groups(
+            cluster_metrics,
+            [c.coords for c in clusters],
+            workers,
+            metrics,
+            world_coords,
+            group_args=[(np.array(c.hull).reshape(-1, 2),) for c in clusters],
+        )
+        for cluster, (diameter, centroid) in zip(clusters, results, strict=True):
+            cluster.diameter = diameter
+            if centroid is not None:
+                cluster.centroid = centroid
 
-    # Determine convex hulls
-    for cluster in clusters:
-        cluster.hull = convex_hull(cluster.points)
+        # Determine points closer to other centroids
+        bad_assignments = nearest_centroids(clusters, world_coords)
 
     # Dump some stats
-    statistics(clusters, measure, stats_file)
+    if common.STAGE_STATS in stages:
+        statistics(clusters, metrics, bad_assignments, stats_file)
 
     # Prepares colors for the groups
-    common.prepare_colors(clusters, colors, sort_color)
+    if common.STAGE_COLORS in stages:
+        common.prepare_colors(clusters, colors, sort_color)
 
     # Make simple plot of clusters
     aspect_ratio = (bbox.height) / (bbox.width) if bbox.width > 0 else 1
 
+    # Determine image size
+    image_width = min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio)
+    image_height = min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio)
+
+    # Determine output files
+    plot_file = output_plot
+    if not plot_file and common.OUTPUT_PLOT in outputs:
+        plot_file = base_name + ".plot.html"
+        print(f"Plotting interactive plot to {plot_file}")
+    image_file = output_image
+    if not image_file and common.OUTPUT_IMAGE in outputs:
+        image_file = base_name + ".plot.png"
+        print(f"Plotting image to {image_file}")
+    map_file = output_map
+    if common.OUTPUT_MAP in outputs and not world_coords:
+        # Skip plotting on map, if no geo-coordinates
+        print("No world coordinates, skipping map plotting")
+    elif common.OUTPUT_MAP in outputs and not map_file:
+        map_file = base_name + ".map.html"
+        print(f"Plotting map to {map_file}")
+
+    # Write outputs concurrently (the map and raster image only need the finished clusters, start them right away)
+    # The kaleido renderer is only started if an image is requested (its startup overlaps with creating the figure)
+    kaleido_image = common.OUTPUT_IMAGE in outputs and image_backend == types.ImageBackend.kaleido
+    with common.OutputWriter(verbose, renderer=kaleido_image) as writer:
+        if common.STAGE_MAP in stages and world_coords:
+            writer.submit(
+                "map",
+                map_file,
+                lambda file: create_map(clusters, bbox, no_points, weight_points, custom_map_tile).save(file),
+            )
+        if common.STAGE_RASTER in stages:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: create_raster(
+                    clusters, no_points, weight_points, image_width, image_height, plotly_theme
+                ).save(file),
+            )
+
+        # Create figure
+        if common.STAGE_FIGURE in stages:
+            fig = create_plot(
+                clusters,
+                "lon" if world_coords else "x",
+                "lat" if world_coords else "y",
+                plotly_theme,
+                no_points,
+                weight_points,
+                plot_consolidated,
+                plot_renderer,
+            )
+
+        # Save interactive plot and image
+        if common.OUTPUT_PLOT in outputs:
+            writer.submit("plot", plot_file, lambda file: common.write_html(fig, file, plotly_js))
+        if kaleido_image:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: common.write_image(fig, file, width=image_width, height=image_height),
+            )
+
+
+def create_raster(
+    clusters: list[types.Cluster],
+    no_points: bool,
+    weight_points: float,
+    width: float,
+    height: float,
+    plotly_theme: str,
+) -> raster.Canvas:
+    """
+    Draws the given clusters (filled hulls and points) on a raster canvas in the
+    trace order of create_plot.
+    """
+    canvas = raster.Canvas(width, height, *raster.template_colors(plotly_theme))
+    plotted = [c for c in clusters if c.size > 0]
+    colors = [c.color.hex for c in plotted]
+    hulls = [np.array(c.hull + c.hull[:1]) for c in plotted]
+    # The filled hulls form one trace per cluster, followed by the point traces
+    order = np.arange(len(plotted))
+    canvas.add_fills(hulls, colors, order)
+    canvas.add_lines(hulls, colors, 2, order)
+    if not no_points:
+        canvas.add_markers([c.coords for c in plotted], colors, weight_points * 5)
+    return canvas
+
+
+def create_plot(
+    clusters: list[types.Cluster],
+    label_x: str,
+    label_y: str,
+    plotly_theme: str,
+    no_points: bool,
+    weight_points: float,
+    consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+) -> go.Figure:
+    """
+    Plots the given clusters on a plotly figure. If consolidated, all clusters are
+    packed into few traces (see common.line_traces and common.marker_trace).
+    """
     # Init plot
     fig = go.Figure(
         layout=go.Layout(
-            xaxis_title="lon" if world_coords else "x",
-            yaxis_title="lat" if world_coords else "y",
+            xaxis_title=label_x,
+            yaxis_title=label_y,
             template=plotly_theme,
             margin={"l": 20, "r": 20, "b": 20, "t": 20, "pad": 4},
             font={"size": 18},
@@ -224,72 +504,63 @@ def plot(
     )
 
     # Plot clusters
-    for i, cluster in enumerate(clusters):
-        if len(cluster.points) <= 0:
-            continue
-        # Calculate hull of cluster
-        hull_points = np.array(cluster.hull)
-        # Repeat the first point at the end to close the polygon
-        hull_points = np.append(hull_points, hull_points[0, :].reshape(1, 2), axis=0)
-        # Plot hull
-        fig.add_trace(
-            go.Scatter(
-                x=hull_points[:, 0],
-                y=hull_points[:, 1],
-                mode="lines",
-                line={"color": cluster.color.hex, "width": 2},
-                name=f"Cluster {i+1}",
-                fill="toself",
+    plotted = [(i, c) for i, c in enumerate(clusters) if c.size > 0]
+    # Repeat the first point of each hull at the end to close the polygon
+    hulls = [np.array(c.hull + c.hull[:1]) for _, c in plotted]
+    if consolidated:
+        ids, colors = [i + 1 for i, _ in plotted], [c.color.hex for _, c in plotted]
+        fig.add_traces(common.line_traces(hulls, colors, ids, "Cluster", 2, fill="toself"))
+        if not no_points:
+            fig.add_trace(
+                common.marker_trace(
+                    [c.coords for _, c in plotted], colors, ids, "Cluster", weight_points * 5, plot_renderer
+                )
             )
-        )
-
-    # Plot points
-    if not no_points:
-        for i, cluster in enumerate(clusters):
-            if len(cluster.points) <= 0:
-                continue
-            # Plot points
+    else:
+        for (i, cluster), hull_points in zip(plotted, hulls, strict=True):
+            # Plot hull
             fig.add_trace(
                 go.Scatter(
-                    x=[p.lon for p in cluster.points],
-                    y=[p.lat for p in cluster.points],
-                    mode="markers",
-                    marker={
-                        "size": weight_points * 5,
-                        "color": cluster.color.hex,
-                    },
+                    x=hull_points[:, 0],
+                    y=hull_points[:, 1],
+                    mode="lines",
+                    line={"color": cluster.color.hex, "width": 2},
                     name=f"Cluster {i+1}",
+                    fill="toself",
                 )
             )
 
-    # Save interactive plot
-    plot_file = output_plot
-    if not plot_file:
-        plot_file = base_name + ".plot.html"
-        print(f"Plotting interactive plot to {plot_file}")
-    fig.write_html(plot_file)
+        # Plot points
+        if not no_points:
+            for i, cluster in plotted:
+                # Plot points
+                fig.add_trace(
+                    common.scatter_type(plot_renderer)(
+                        x=cluster.coords[:, 0],
+                        y=cluster.coords[:, 1],
+                        mode="markers",
+                        marker={
+                            "size": weight_points * 5,
+                            "color": cluster.color.hex,
+                        },
+                        name=f"Cluster {i+1}",
+                    )
+                )
 
-    # Save plot image
-    image_file = output_image
-    if not image_file:
-        image_file = base_name + ".plot.png"
-        print(f"Plotting image to {image_file}")
-    fig.write_image(
-        image_file,
-        width=min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio),
-        height=min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio),
-    )
+    # Return figure
+    return fig
 
-    # Skip plotting on map, if no geo-coordinates
-    if not world_coords:
-        print("No world coordinates, skipping map plotting")
-        quit()
 
-    # Make map plot of routes
-    map_file = output_map
-    if not map_file:
-        map_file = base_name + ".map.html"
-        print(f"Plotting map to {map_file}")
+def create_map(
+    clusters: list[types.Cluster],
+    bbox: types.BoundingBox,
+    no_points: bool,
+    weight_points: float,
+    custom_map_tile: list[str],
+) -> folium.Map:
+    """
+    Plots the given clusters on a folium map.
+    """
     m, base_tree = common.create_map(
         (bbox.max_x + bbox.min_x) / 2.0,
         (bbox.max_y + bbox.min_y) / 2.0,
@@ -300,7 +571,7 @@ def plot(
 
     # Plot the clusters themselves
     for i, cluster in enumerate(clusters):
-        if len(cluster.points) <= 0:
+        if cluster.size <= 0:
             continue
         layer_name = f"Cluster {i+1}"
         plot_groups[i] = folium.FeatureGroup(name=layer_name)
@@ -318,17 +589,18 @@ def plot(
     # Plot the individual points
     if not no_points:
         for i, cluster in enumerate(clusters):
-            for point in cluster.points:
-                d = point.desc.replace("\n", "<br/>").replace(r"`", r"\`")
-                text = (
-                    f"<p>Location (lon/lat): {point[0]}, {point[1]}</p" + f"JSON:</br><pre><code>{d}</code></pre></br>"
-                )
+            for point, target in zip(cluster.points, cluster.reassignments.tolist(), strict=True):
+                text = f"<p>Location (lon/lat): {point[0]}, {point[1]}</p>"
+                if target >= 0:
+                    text += f"<p>Closer to centroid of cluster {target+1}</p>"
+                text += common.desc_html(point)
                 plot_map_point(
                     plot_groups[i],
                     point,
                     text,
                     weight_points,
                     cluster.color.hex,
+                    COLOR_MISASSIGNED if target >= 0 else None,
                 )
 
     # Add all grouped parts to the map
@@ -362,22 +634,23 @@ def plot(
     # Fit map to bounds
     m.fit_bounds([[bbox.min_y, bbox.min_x], [bbox.max_y, bbox.max_x]])
 
-    # Save map
-    m.save(map_file)
+    return m
 
 
-def plot_map_point(map, point, text, weight, color):
+def plot_map_point(map, point, text, weight, color, highlight=None):
     """
-    Plots a point on the given map.
+    Plots a point on the given map. If a highlight color is given,
+    it is used for the outline of the point.
     """
     popup_text = folium.Html(text, script=True)
     popup = folium.Popup(popup_text, max_width=450, sticky=True)
     marker = folium.Circle(
         (point[1], point[0]),  # folium operates on lat/lon
-        color=color,
+        color=highlight if highlight else color,
         popup=popup,
         radius=15 * weight,
         fill=True,
+        fill_color=color,
         fillOpacity=1.0,
     )
     marker.options["fillOpacity"] = 1.0
@@ -406,46 +679,31 @@ def plot_map_cluster(
 
 def statistics(
     clusters: list[types.Cluster],
-    measure: Callable[[types.Position, types.Position], float],
+    metrics: accumulators.Summaries,
+    bad_assignments: int,
     stats_file: str,
 ):
     """
-    Outlines some route statistics. Statistics are written to file, if provided.
+    Outlines some cluster statistics (from the given metrics, see cluster_metrics).
+    Statistics are written to file, if provided.
     """
     # Collect statistics
-    sizes, diameters = [r.size for r in clusters], [r.diameter for r in clusters]
-    sum_of_max_distances = sum([c.max_distance_from_centroid for c in clusters])
-    max_distance = max([c.max_distance_from_centroid for c in clusters])
-    sum_of_distances = sum([c.sum_of_distances_from_centroid for c in clusters])
-    wcss = sum([c.wcss for c in clusters])
-    bad_assignments = 0
-    for c in clusters:
-        for p in c.points:
-            distance_to_centroid = measure(c.centroid, p)
-            distances_to_other_centroids = np.array(
-                [[measure(c2.centroid, p) for c2 in clusters if hasattr(c2, "centroid")]]
-            )
-            if len(distances_to_other_centroids[distance_to_centroid > distances_to_other_centroids]):
-                bad_assignments += 1
+    sizes, diameters = metrics["size"], metrics["diameter"]
+    sum_of_max_distances = metrics["distance_max"].total
+    max_distance = metrics["distance_max"].max
+    sum_of_distances = metrics["distance_sum"].total
+    wcss = metrics["wcss"].total
 
     stats = [
-        types.Stat("npoints", "Total points", sum([len(c.points) for c in clusters])),
+        types.Stat("npoints", "Total points", int(sizes.total)),
         types.Stat("nclusters", "Cluster count", len(clusters)),
-        types.Stat("clust_size_max", "Cluster size (max)", max(sizes)),
-        types.Stat("clust_size_min", "Cluster size (min)", min(sizes)),
-        types.Stat("clust_size_avg", "Cluster size (avg)", sum(sizes) / float(len(clusters))),
-        types.Stat(
-            "cluster_size_var",
-            "Cluster size (variance)",
-            np.var(np.array([len(c.points) for c in clusters])),
-        ),
-        types.Stat("clust_diam_max", "Cluster diameter (max)", max(diameters)),
-        types.Stat("clust_diam_min", "Cluster diameter (min)", min(diameters)),
-        types.Stat(
-            "clust_diam_avg",
-            "Cluster diameter (avg)",
-            sum(diameters) / float(len(clusters)),
-        ),
+        types.Stat("clust_size_max", "Cluster size (max)", int(sizes.max)),
+        types.Stat("clust_size_min", "Cluster size (min)", int(sizes.min)),
+        types.Stat("clust_size_avg", "Cluster size (avg)", sizes.avg),
+        types.Stat("cluster_size_var", "Cluster size (variance)", sizes.variance),
+        types.Stat("clust_diam_max", "Cluster diameter (max)", diameters.max),
+        types.Stat("clust_diam_min", "Cluster diameter (min)", diameters.min),
+        types.Stat("clust_diam_avg", "Cluster diameter (avg)", diameters.avg),
         types.Stat(
             "sum_max_distances",
             "Sum of max distances from centroid",
@@ -1,16 +1,34 @@
+import argparse
+import atexit
+import concurrent.futures
+import dataclasses
+import functools
 import json
 import math
+import os
+import queue
+import re
+import shutil
 import sys
+import threading
+import time
 
 import colorutils
 import folium
 import jsonpath_ng
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+import plotly.io
+import scipy.spatial
 
-from . import types
+from . import parallel, types
 
 # ==================== Shared constants
 
 IMAGE_SIZE = 2000
+PLOTLY_JS_INLINE = "inline"  # embeds plotly.js in every interactive plot
+PLOTLY_JS_DIRECTORY = "directory"  # shares plotly.min.js next to the interactive plots
 
 # ==================== Shared arguments
 
@@ -107,52 +125,354 @@ def generic_arguments(parser):
         default="",
         help="path to file where detailed stats should be written",
     )
+    parser.add_argument(
+        "--no_desc",
+        dest="no_desc",
+        action="store_true",
+        default=False,
+        help="indicates whether to drop the JSON descriptions of the points"
+        + " (omits them from map popups, reduces memory usage)",
+    )
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        default=False,
+        help="indicates whether to stream the input JSON, only decoding the elements matched by the JSON paths"
+        + " (reduces memory usage for large inputs, requires plain dotted JSON paths)",
+    )
+    parser.add_argument(
+        "--float32",
+        dest="float32",
+        action="store_true",
+        default=False,
+        help="indicates whether to store coordinates in single precision (halves memory usage, reduces accuracy)",
+    )
+    parser.add_argument(
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        default=False,
+        help="indicates whether to print additional diagnostic information",
+    )
+    parser.add_argument(
+        "--plot_consolidated",
+        dest="plot_consolidated",
+        action="store_true",
+        default=False,
+        help="indicates whether to pack the interactive plot into few traces"
+        + " (one line trace per color and one marker trace, speeds up plots of many groups)",
+    )
+    parser.add_argument(
+        "--plot_renderer",
+        type=types.PlotRenderer,
+        choices=list(types.PlotRenderer),
+        default=types.PlotRenderer.svg.value,
+        help="renderer of the interactive plot (webgl handles many more points in the browser)",
+    )
+    parser.add_argument(
+        "--plotly_js",
+        type=str,
+        nargs="?",
+        default=PLOTLY_JS_INLINE,
+        help="how to include plotly.js in the interactive plot: inline (embedded in each file), "
+        + "directory (shared plotly.min.js next to the plot) or the path of a local asset directory "
+        + "(plotly.js is written there once and referenced by the plot)",
+    )
+    parser.add_argument(
+        "--image_backend",
+        type=types.ImageBackend,
+        choices=list(types.ImageBackend),
+        default=types.ImageBackend.kaleido.value,
+        help="backend for writing the plot image (raster draws large datasets directly, requires Pillow)",
+    )
+    parser.add_argument(
+        "--outputs",
+        type=output_list,
+        nargs="?",
+        default=",".join(OUTPUTS),
+        help="comma-separated list of outputs to produce (plot, image, map, stats),"
+        + " only the processing they need is done (e.g.: stats,map)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="?",
+        default=1,
+        help="number of worker processes used for calculating statistics"
+        + " (small inputs are processed in a single process)",
+    )
+
+
+# ==================== JSON path handling
+
+
+# Matches plain dotted paths with [*] and [n] indexers (e.g.: "solutions[-1].vehicles[*].route")
+JPATH_FIELD, JPATH_INDEX = r"[A-Za-z_][A-Za-z0-9_]*", r"\[(?:\*|-?\d+)\]"
+SIMPLE_JPATH = re.compile(rf"^{JPATH_FIELD}(?:{JPATH_INDEX})*(?:\.{JPATH_FIELD}(?:{JPATH_INDEX})*)*$")
+SIMPLE_JPATH_STEP = re.compile(rf"(?:^|\.)({JPATH_FIELD})|\[(\*|-?\d+)\]")
+SIMPLE_JPATH_RESERVED = {"where"}
+
+# Step kinds of simple JSON paths
+STEP_FIELD, STEP_INDEX, STEP_ALL = 0, 1, 2
+
+
+class SimpleMatch:
+    """
+    A match of a simple JSON path. Mirrors the value and full_path attributes
+    of jsonpath_ng matches.
+    """
+
+    __slots__ = ("value", "_expr", "_indices")
+
+    def __init__(self, value, expr, indices):
+        self.value = value
+        self._expr = expr
+        self._indices = indices
+
+    @property
+    def full_path(self) -> str:
+        """
+        Returns the full path of the match (formatted like jsonpath_ng does).
+        """
+        return self._expr.format_path(self._indices)
+
+
+class SimpleJsonPath:
+    """
+    Direct accessor for plain dotted JSON paths consisting of fields, [*] and
+    [n] indexers only. Walks dicts and lists directly instead of using the
+    generic jsonpath_ng machinery, but matches the same values.
+    """
+
+    def __init__(self, jpath: str, steps: list[tuple[int, object]]):
+        self.jpath = jpath
+        self.steps = steps
+        self.single = all(kind != STEP_ALL for kind, _ in steps)
+
+    def __str__(self):
+        return self.jpath
+
+    def format_path(self, indices: tuple[int, ...]) -> str:
+        """
+        Formats the full path of a match given the indices chosen at the [*] steps.
+        """
+        parts, wildcard = [], 0
+        for kind, arg in self.steps:
+            if kind == STEP_FIELD:
+                parts.append(arg)
+            elif kind == STEP_INDEX:
+                parts.append(f"[{arg}]")
+            else:
+                parts.append(f"[{indices[wildcard]}]")
+                wildcard += 1
+        return ".".join(parts)
+
+    def find(self, data) -> list[SimpleMatch]:
+        """
+        Returns all matches in the given data.
+        """
+        # Fast track for paths yielding at most one value
+        if self.single:
+            for kind, arg in self.steps:
+                if kind == STEP_FIELD:
+                    if not isinstance(data, dict) or arg not in data:
+                        return []
+                    data = data[arg]
+                else:
+                    if not isinstance(data, list) or not -len(data) <= arg < len(data):
+                        return []
+                    data = data[arg]
+            return [SimpleMatch(data, self, ())]
+        return self.find_at(data, 0, ())
+
+    def find_at(self, data, step: int, indices: tuple[int, ...]) -> list[SimpleMatch]:
+        """
+        Returns all matches for data reached at the given step of the path,
+        where indices are the ones chosen at the preceding [*] steps.
+        """
+        # Walk all branches, tracking the indices chosen at [*] steps
+        current = [(data, indices)]
+        for kind, arg in self.steps[step:]:
+            matched = []
+            for value, indices in current:
+                if kind == STEP_FIELD:
+                    if isinstance(value, dict) and arg in value:
+                        matched.append((value[arg], indices))
+                elif kind == STEP_INDEX:
+                    if isinstance(value, list) and -len(value) <= arg < len(value):
+                        matched.append((value[arg], indices))
+                elif not value:
+                    continue  # Nothing to iterate, like jsonpath_ng
+                elif isinstance(value, list):
+                    matched.extend((v, (*indices, i)) for i, v in enumerate(value))
+                else:
+                    matched.append((value, (*indices, 0)))  # Single values are treated as one-element lists
+            current = matched
+        return [SimpleMatch(value, self, indices) for value, indices in current]
+
+
+def compile_simple_jpath(jpath: str) -> SimpleJsonPath | None:
+    """
+    Compiles the given JSON path to a direct accessor, if it is a plain dotted
+    path with [*] and [n] indexers only. Returns None for all other paths.
+    """
+    if not SIMPLE_JPATH.match(jpath):
+        return None
+    steps = []
+    for field, index in SIMPLE_JPATH_STEP.findall(jpath):
+        if field:
+            if field in SIMPLE_JPATH_RESERVED:
+                return None
+            steps.append((STEP_FIELD, field))
+        elif index == "*":
+            steps.append((STEP_ALL, None))
+        else:
+            steps.append((STEP_INDEX, int(index)))
+    return SimpleJsonPath(jpath, steps)
+
+
+@functools.cache
+def parse_jpath(jpath: str):
+    """
+    Parses the given JSON path expression. Plain dotted paths are compiled to
+    direct accessors, all others are handled by jsonpath_ng. Compiled
+    expressions are cached process-wide, i.e., repeated calls for the same
+    path are free.
+    """
+    simple = compile_simple_jpath(jpath)
+    if simple is not None:
+        return simple
+    return jsonpath_ng.parse(jpath)
+
+
+def jpath_cache_info():
+    """
+    Returns the hit/miss counters of the compiled JSON path cache.
+    """
+    return parse_jpath.cache_info()
+
+
+def print_jpath_cache_info():
+    """
+    Logs the hit/miss counters of the compiled JSON path cache.
+    """
+    info = jpath_cache_info()
+    print(f"JSON path cache: {info.hits} hits, {info.misses} misses, {info.currsize} compiled expressions")
 
 
 # ==================== Shared code
 
 
-def load_data(input_groups: str, input_positions: str) -> tuple[str, str, str]:
+class JsonDocument:
+    """
+    JSON input that is decoded at most once. All extractions from the same
+    input share the decoded tree.
+    """
+
+    # Counts decoded documents and requests for decoded documents (process-wide)
+    decodes = 0
+    requests = 0
+
+    def __init__(self, content: str):
+        self.content = content
+        self.decoded = False
+        self.tree = None
+
+    def data(self):
+        """
+        Returns the decoded JSON tree (decoding it on first use).
+        """
+        JsonDocument.requests += 1
+        if not self.decoded:
+            self.tree = json.loads(self.content)
+            self.content = None  # The raw content is not needed anymore
+            self.decoded = True
+            JsonDocument.decodes += 1
+        return self.tree
+
+    def find(self, jpath: str) -> list:
+        """
+        Returns the matches of the given JSON path.
+        """
+        return parse_jpath(jpath).find(self.data())
+
+
+def load_document(input: str) -> JsonDocument:
     """
-    Loads the raw location and position data.
+    Loads the JSON document from the given file (or stdin, if no file is given).
     """
-    content_locations = ""
-    if len(input_groups) > 0:
-        with open(input_groups) as jsonFile:
-            content_locations = jsonFile.read()
+    if len(input) > 0:
+        with open(input) as jsonFile:
+            content = jsonFile.read()
     else:
-        content_locations = "".join(sys.stdin.readlines())
-    content_positions = content_locations
-    if len(input_positions) > 0:
-        with open(input_positions) as jsonFile:
-            content_positions = jsonFile.read()
+        content = "".join(sys.stdin.readlines())
+    return JsonDocument(content)
+
+
+def print_document_info():
+    """
+    Logs how many JSON decodes were conducted and saved by sharing documents.
+    """
+    decodes, saved = JsonDocument.decodes, JsonDocument.requests - JsonDocument.decodes
+    print(f"JSON documents: {decodes} decoded, {saved} decodes saved")
 
-    return content_locations, content_positions
+
+def load_data(input_groups: str, input_positions: str) -> tuple[JsonDocument, JsonDocument]:
+    """
+    Loads the location and position data. Positions are read from the location
+    input, if no separate position input is given. Both share one document,
+    if they refer to the same input, such that it is only read and decoded once.
+    """
+    document_locations = load_document(input_groups)
+    document_positions = document_locations
+    if len(input_positions) > 0 and input_positions != input_groups:
+        document_positions = load_document(input_positions)
+
+    return document_locations, document_positions
+
+
+def describe(value) -> str:
+    """
+    Serializes the given JSON value for display purposes.
+    """
+    return json.dumps(value, indent=2, sort_keys=True)
 
 
-def extract_position(value, jpath_x="", jpath_y="") -> types.Position:
+def desc_html(point: types.Position) -> str:
     """
-    Extracts one point from the given JSON by either using the given
-    relative JSON path or assuming a two-element list of float.
+    Returns the description of the given position formatted for a map popup.
+    Returns an empty string, if the position has no description.
+    """
+    desc = point.description()
+    if not desc:
+        return ""
+    d = desc.replace("\n", "<br/>").replace(r"`", r"\`")
+    return f"JSON:</br><pre><code>{d}</code></pre></br>"
+
+
+def extract_coordinates(value, jpath_x="", jpath_y="") -> tuple[float, float]:
+    """
+    Extracts the coordinates of one point from the given JSON by either using
+    the given relative JSON path or assuming a two-element list of float.
     """
     try:
-        desc = json.dumps(value, indent=2, sort_keys=True)
         if jpath_x and jpath_y:
-            x_expr, y_expr = jsonpath_ng.parse(jpath_x), jsonpath_ng.parse(jpath_y)
+            x_expr, y_expr = parse_jpath(jpath_x), parse_jpath(jpath_y)
             x_val, y_val = x_expr.find(value), y_expr.find(value)
             if len(x_val) != 1:
-                raise Exception(f"unable to parse x value from {desc} using {jpath_x}")
+                raise Exception(f"unable to parse x value from {describe(value)} using {jpath_x}")
             if len(y_val) != 1:
-                raise Exception(f"unable to parse y value from {desc} using {jpath_y}")
-            return types.Position(float(x_val[0].value), float(y_val[0].value), desc)
+                raise Exception(f"unable to parse y value from {describe(value)} using {jpath_y}")
+            return float(x_val[0].value), float(y_val[0].value)
         else:
-            return types.Position(float(value[0]), float(value[1]), desc)
+            return float(value[0]), float(value[1])
     except Exception:
         print(
             f"error parsing point using {jpath_x} and {jpath_y}, "
             + "please make sure the paths point to valid numbers x/y. point data:"
         )
-        print(desc)
+        print(describe(value))
         raise
 
 
@@ -170,53 +490,57 @@ def extract_position_groups(
     jpath_pos,
     jpath_x="",
     jpath_y="",
-) -> list[list[types.Position]]:
+    keep_desc=True,
+    dtype=np.float64,
+) -> types.PositionArray:
     """
-    Extracts grouped positions (as in clusters, routes) from JSON.
+    Extracts grouped positions (as in clusters, routes) from JSON documents
+    (see JsonDocument and jsonstream.StreamedDocument).
     If no specific path for positions (jpath_pos) is given,
     it is assumed that the path to the groups (jpath_groups)
     already is a list of positions. Furthermore, jpath_x & jpath_x
     can be used to further modify the location of the positions,
     if they are not a list of length two (but instead an object with
-    x, y fields for example).
+    x, y fields for example). If keep_desc is false, the JSON descriptions
+    of the positions are dropped. The coordinates are stored using the
+    given dtype.
     """
     # Extract all positions, if given explicitly
-    positions = []
+    positions, pos_raws = [], []
     if jpath_pos:
-        point_data = json.loads(json_pos)
-        point_expression = jsonpath_ng.parse(jpath_pos)
-        for match in point_expression.find(point_data):
+        for match in json_pos.find(jpath_pos):
             if is_two_tuple(match.value, (int, float)):  # It's already a point
-                positions.append(extract_position(match.value, jpath_x, jpath_y))
+                positions.append(extract_coordinates(match.value, jpath_x, jpath_y))
+                pos_raws.append(match.value)
             elif isinstance(match.value, list):  # It's a list of positions
                 for point_val in match.value:
-                    positions.append(extract_position(point_val, jpath_x, jpath_y))
+                    positions.append(extract_coordinates(point_val, jpath_x, jpath_y))
+                    pos_raws.append(point_val)
             else:  # We cannot handle this case
                 raise f"not processable value format for a point: {match.value}"
-    # Extract groups of values
-    group_data = json.loads(json_groups)
-    group_expression = jsonpath_ng.parse(jpath_groups)
     # Extract all groups
-    groups, oob_indices = [], []
-    for match in group_expression.find(group_data):
+    coords, raws, offsets, oob_indices = [], [], [0], []
+    for match in json_groups.find(jpath_groups):
         # If the value is null, we skip it (with a warning)
         if match.value is None:
             print(f"Warning! Found 'null' value at {str(match.full_path)}, skipping...")
             continue
         # If no separate position file was given, we expect positions to be given
-        group = []
         if len(positions) == 0:
             if is_two_tuple(match.value, float) or is_two_tuple(match.value, int):
-                group.append(extract_position(match.value))
+                coords.append(extract_coordinates(match.value))
+                raws.append(match.value)
             else:
                 if isinstance(match.value, list):
                     for val in match.value:
                         if is_two_tuple(val, float) or is_two_tuple(val, int):
-                            group.append(extract_position(val))
+                            coords.append(extract_coordinates(val))
                         else:
-                            group.append(extract_position(val, jpath_x, jpath_y))
+                            coords.append(extract_coordinates(val, jpath_x, jpath_y))
+                        raws.append(val)
                 else:
-                    group.append(extract_position(match.value, jpath_x, jpath_y))
+                    coords.append(extract_coordinates(match.value, jpath_x, jpath_y))
+                    raws.append(match.value)
         # Else we expect indices pointing to the list of positions
         else:
             # Extract full list of indices for the group
@@ -237,31 +561,35 @@ def extract_position_groups(
             # Convert indices to points
             for index in indices:
                 if 0 <= index < len(positions):
-                    group.append(positions[index].clone())
+                    coords.append(positions[index])
+                    raws.append(pos_raws[index])
                 else:
                     oob_indices.append(index)
-        groups.append(group)
+        offsets.append(len(coords))
     # Warn about out-of-bound indices
     if len(oob_indices) > 0:
         oobs = ", ".join([str(e) for e in oob_indices])
         print(f"Warning! {len(oob_indices)} indices were out of bounds and ignored: {oobs}")
     # Return
-    return groups
+    return types.PositionArray(
+        np.array(coords, dtype=dtype).reshape(-1, 2),
+        np.array(offsets, dtype=np.int64),
+        raws if keep_desc else None,
+    )
 
 
-def preprocess_coordinates(points, swap, desired_coordinates):
+def preprocess_coordinates(points: types.PositionArray, swap, desired_coordinates):
     """
     Checks the given positions for being from world coordinate domain
     and performs some additional checks.
     """
     # Swap points, if desired
     if swap:
-        for pl in points:
-            for p in pl:
-                p.lon, p.lat = p.lat, p.lon
-    # Check all positions against valid world coordinate ranges
-    all_lon_ok = all((-180 <= p[0] <= 180) for point in points for p in point)
-    all_lat_ok = all((-90 <= p[1] <= 90) for point in points for p in point)
+        points.swap()
+    # Check all positions against valid world coordinate ranges (using the bounds of all groups)
+    bounds = points.bounds()[points.sizes() > 0]
+    all_lon_ok = bool(np.all((-180 <= bounds[:, 0]) & (bounds[:, 1] <= 180)))
+    all_lat_ok = bool(np.all((-90 <= bounds[:, 2]) & (bounds[:, 3] <= 90)))
     # Determine position nature
     world_coords = all_lon_ok and all_lat_ok
     if desired_coordinates == "euclidean":
@@ -304,6 +632,36 @@ def cw_angle_distance(origin, point):
     return angle, lenvector
 
 
+def cw_angles_distances(origin: np.ndarray, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gets angles and distances for all given (n, 2) points that can be used for sorting
+    (see cw_angle_distance).
+    """
+    vectors = np.asarray(points, dtype=np.float64) - origin
+    distances = np.hypot(vectors[:, 0], vectors[:, 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = vectors / distances[:, None]
+    angles = np.arctan2(normalized[:, 0], normalized[:, 1])
+    angles = np.where(angles < 0, 2 * math.pi + angles, angles)
+    # If length is zero there is no angle
+    angles[distances == 0] = -math.pi
+    return angles, distances
+
+
+def group_centroids(point_groups: list) -> np.ndarray:
+    """
+    Returns the centroids of the given point groups as (n, 2) array (NaN for
+    empty groups).
+    """
+    coords, sizes = types.PositionGroup.stack_coords(point_groups)
+    centroids = np.full((len(point_groups), 2), np.nan)
+    filled = sizes > 0
+    if np.any(filled):
+        starts = (np.cumsum(sizes) - sizes)[filled]
+        centroids[filled] = np.add.reduceat(coords, starts, axis=0, dtype=np.float64) / sizes[filled, None]
+    return centroids
+
+
 def haversine(p1, p2):
     """
     Calculate the great circle distance between two points
@@ -330,14 +688,296 @@ def euclidean(p1, p2):
     return math.sqrt(math.pow(p1[0] - p2[0], 2) + math.pow(p1[1] - p2[1], 2))
 
 
-def bounding_box(points) -> types.BoundingBox:
+def position_coords(positions: list[types.Position]) -> np.ndarray:
+    """
+    Returns the coordinates of the given positions as an (n, 2) array.
+    """
+    return np.array([(p.lon, p.lat) for p in positions], dtype=np.float64).reshape(-1, 2)
+
+
+def haversine_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calculates the great circle distances between the given arrays of points
+    (lon/lat in decimal degrees along the last axis, broadcast against each other).
+    Array version of haversine.
+    """
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    # convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = np.radians(a[..., 0]), np.radians(a[..., 1]), np.radians(b[..., 0]), np.radians(b[..., 1])
+
+    # haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(h))
+    r = 6371  # Radius of earth in kilometers
+    return c * r
+
+
+def euclidean_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calculates the euclidean distances between the given arrays of points
+    (x/y along the last axis, broadcast against each other).
+    Array version of euclidean.
+    """
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return np.sqrt((a[..., 0] - b[..., 0]) ** 2 + (a[..., 1] - b[..., 1]) ** 2)
+
+
+def haversine_consecutive(coords: np.ndarray) -> np.ndarray:
+    """
+    Calculates the great circle distances between consecutive points of the given (n, 2) array.
+    """
+    return haversine_distances(coords[1:], coords[:-1])
+
+
+def euclidean_consecutive(coords: np.ndarray) -> np.ndarray:
+    """
+    Calculates the euclidean distances between consecutive points of the given (n, 2) array.
+    """
+    return euclidean_distances(coords[1:], coords[:-1])
+
+
+def haversine_one_to_many(point, coords: np.ndarray) -> np.ndarray:
+    """
+    Calculates the great circle distances from the given point to all points of the given (n, 2) array.
+    """
+    return haversine_distances(np.asarray(point, dtype=np.float64), coords)
+
+
+def euclidean_one_to_many(point, coords: np.ndarray) -> np.ndarray:
+    """
+    Calculates the euclidean distances from the given point to all points of the given (n, 2) array.
+    """
+    return euclidean_distances(np.asarray(point, dtype=np.float64), coords)
+
+
+def haversine_many_to_many(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calculates the (n, m) matrix of great circle distances between the given (n, 2) and (m, 2) arrays.
+    """
+    return haversine_distances(a[:, None, :], b[None, :, :])
+
+
+def euclidean_many_to_many(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calculates the (n, m) matrix of euclidean distances between the given (n, 2) and (m, 2) arrays.
+    """
+    return euclidean_distances(a[:, None, :], b[None, :, :])
+
+
+def unit_sphere(coords: np.ndarray) -> np.ndarray:
+    """
+    Embeds the given (n, 2) lon/lat coordinates (decimal degrees) on the 3D unit sphere.
+    The chord length between embedded points grows monotonically with their great circle distance.
+    """
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+SIMPLIFY_TOLERANCE = 0.5  # max. deviation of simplified geometry (in pixels of the plot image)
+
+
+def simplify_lines(lines: list[np.ndarray], tolerance: float) -> list[np.ndarray]:
+    """
+    Simplifies the given (n, 2) polylines using the Douglas-Peucker algorithm and returns
+    the indices of the kept vertices of each line. The first and last vertex of a line are
+    always kept, no removed vertex deviates more than tolerance from the simplified line.
+    All lines are processed at once, splitting every open interval per iteration.
+    """
+    sizes = np.array([len(line) for line in lines], dtype=np.int64)
+    offsets = np.cumsum(sizes) - sizes
+    coords = np.concatenate([np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines] + [np.empty((0, 2))])
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[offsets[sizes > 0]] = True
+    keep[(offsets + sizes - 1)[sizes > 0]] = True
+    # Open intervals (start and end vertex) with interior vertices
+    starts, ends = offsets[sizes > 2], (offsets + sizes - 1)[sizes > 2]
+    while len(starts) > 0:
+        counts = ends - starts - 1
+        interval = np.repeat(np.arange(len(starts)), counts)
+        first = np.cumsum(counts) - counts
+        index = starts[interval] + 1 + np.arange(len(interval)) - first[interval]
+        # Distance of the interior vertices to the segment of their interval
+        a, b = coords[starts[interval]], coords[ends[interval]]
+        delta, offset = b - a, coords[index] - a
+        length_squared = (delta**2).sum(axis=1)
+        t = np.divide((offset * delta).sum(axis=1), length_squared, out=np.zeros(len(index)), where=length_squared > 0)
+        distances = np.hypot(*(offset - np.clip(t, 0, 1)[:, None] * delta).T)
+        # Split each interval at its farthest vertex (first one on ties), if it is out of tolerance
+        farthest = np.maximum.reduceat(distances, first)
+        candidates = np.flatnonzero(distances == farthest[interval])
+        candidates = candidates[np.r_[True, interval[candidates[1:]] != interval[candidates[:-1]]]]
+        split = farthest > tolerance
+        splits = index[candidates][split]
+        keep[splits] = True
+        starts, ends = np.concatenate([starts[split], splits]), np.concatenate([splits, ends[split]])
+        starts, ends = starts[ends - starts > 1], ends[ends - starts > 1]
+    return [np.flatnonzero(keep[o : o + n]) for o, n in zip(offsets.tolist(), sizes.tolist(), strict=True)]
+
+
+DIAMETER_BLOCK = 1 << 22  # max. number of distances calculated at once
+DIAMETER_TOLERANCE = 1e-9  # relative slack for pruning and tie detection
+
+
+def hull_vertices(coords: np.ndarray) -> np.ndarray:
+    """
+    Returns the convex hull vertices of the given (n, 2) coordinates. If the
+    hull is degenerate (e.g., collinear points), the extreme points are returned.
+    """
+    try:
+        return coords[scipy.spatial.ConvexHull(coords).vertices]
+    except (scipy.spatial.QhullError, ValueError):
+        extremes = [coords[:, 0].argmin(), coords[:, 0].argmax(), coords[:, 1].argmin(), coords[:, 1].argmax()]
+        return coords[np.unique(extremes)]
+
+
+def farthest_pairs(a: np.ndarray, b: np.ndarray, many_to_many) -> tuple[float, np.ndarray]:
+    """
+    Determines the max. distance between the points of a and b (calculated block-wise)
+    and returns it along with all pairs (as (k, 2, 2) coordinates) within tolerance of it.
+    """
+    best, candidates = 0.0, []
+    rows = max(1, DIAMETER_BLOCK // max(len(b), 1))
+    for start in range(0, len(a), rows):
+        block = a[start : start + rows]
+        d = many_to_many(block, b)
+        best = max(best, float(d.max()))
+        i, j = np.nonzero(d >= best * (1 - DIAMETER_TOLERANCE))
+        candidates.append((d[i, j], np.stack([block[i], b[j]], axis=1)))
+    values = np.concatenate([v for v, _ in candidates])
+    pairs = np.concatenate([p for _, p in candidates])
+    return best, pairs[values >= best * (1 - DIAMETER_TOLERANCE)]
+
+
+def diameter(coords: np.ndarray, world_coords: bool, hull: np.ndarray = None) -> float:
     """
-    Calculates the bounding box of the given points.
+    Calculates the diameter (max. distance between any two points) of the given
+    (n, 2) coordinates. The farthest pair of hull vertices yields a lower bound.
+    Then, only points that can be part of a farther pair (by the triangle inequality)
+    are compared exhaustively. The result equals the max. of the scalar measure over
+    all pairs. The hull vertices can be passed in, if already known.
+    """
+    measure = haversine if world_coords else euclidean
+    one_to_many = haversine_one_to_many if world_coords else euclidean_one_to_many
+    many_to_many = haversine_many_to_many if world_coords else euclidean_many_to_many
+    points = np.unique(np.asarray(coords, dtype=np.float64).reshape(-1, 2), axis=0)
+    if len(points) <= 1:
+        return 0
+    # Determine lower bound from the hull vertices
+    if hull is None:
+        hull = hull_vertices(points)
+    hull = np.asarray(hull, dtype=np.float64).reshape(-1, 2)
+    lower, pairs = farthest_pairs(hull, hull, many_to_many)
+    # Only keep points that may be part of a farther pair, i.e., for center c and radius r:
+    # d(p, q) <= d(p, c) + d(c, q) <= d(p, c) + r
+    center = pairs[0].mean(axis=0)
+    distances = one_to_many(center, points)
+    candidates = points[distances + distances.max() >= lower * (1 - DIAMETER_TOLERANCE)]
+    # Compare remaining candidates exhaustively and settle the max. using the scalar measure
+    _, pairs = farthest_pairs(candidates, candidates, many_to_many)
+    return max(measure(p1, p2) for p1, p2 in pairs.tolist())
+
+
+PAIRWISE_MEMORY = 256  # default memory budget for pairwise distance calculations (in MB)
+PAIRWISE_TEMPORARIES = 6  # number of temporary arrays per distance tile (of the haversine kernel)
+
+
+def pairwise_tile_size(memory_budget: float) -> int:
+    """
+    Returns the edge length of square distance tiles fitting into the given memory budget (in MB).
+    """
+    return max(1, int(math.sqrt(memory_budget * 1024 * 1024 / (8 * PAIRWISE_TEMPORARIES))))
+
+
+def pairwise_tiles(count: int, tile_size: int) -> list[tuple[int, int]]:
+    """
+    Returns the start indices of all tiles of the upper triangle (incl. diagonal)
+    of the distance matrix of the given number of points.
+    """
+    starts = range(0, count, tile_size)
+    return [(i, j) for i in starts for j in starts if j >= i]
+
+
+def pairwise_tile_stats(coords: np.ndarray, tile: tuple[int, int], world_coords: bool, tile_size: int):
+    """
+    Calculates min, max and sum of the distances of all pairs (i, j) with i <= j in the given tile.
+    """
+    many_to_many = haversine_many_to_many if world_coords else euclidean_many_to_many
+    i, j = tile
+    d = many_to_many(coords[i : i + tile_size], coords[j : j + tile_size])
+    if i == j:
+        d = d[np.triu_indices(len(d), m=d.shape[1])]
+    return float(d.min()), float(d.max()), float(d.sum())
+
+
+def pairwise_distance_stats(
+    coords: np.ndarray,
+    world_coords: bool,
+    memory_budget: float = PAIRWISE_MEMORY,
+    workers: int = 1,
+) -> tuple[float, float, float, int]:
+    """
+    Calculates min, max, sum and count of the distances of all pairs (i, j) with i <= j
+    (i.e., including each point with itself) of the given (n, 2) coordinates. The distance
+    matrix is processed in tiles, such that roughly at most memory_budget MB are used
+    (per worker process).
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    if n <= 0:
+        return 0.0, 0.0, 0.0, 0
+    tile_size = pairwise_tile_size(memory_budget)
+    minimum, maximum, total = math.inf, 0.0, 0.0
+    tiles = pairwise_tiles(n, tile_size)
+    results = parallel.run(pairwise_tile_stats, coords, tiles, workers, world_coords, tile_size)
+    for tile_min, tile_max, tile_sum in results:
+        minimum, maximum, total = min(minimum, tile_min), max(maximum, tile_max), total + tile_sum
+    return minimum, maximum, total, n * (n + 1) // 2
+
+
+def sampled_distance_stats(
+    coords: np.ndarray,
+    world_coords: bool,
+    samples: int,
+    seed: int = 0,
+) -> tuple[float, float, float]:
+    """
+    Estimates the average distance of all pairs (i, j) with i <= j of the given (n, 2)
+    coordinates from the given number of randomly sampled pairs. Returns the min. distance
+    (exactly 0, as every point is paired with itself), the estimated average and the
+    half-width of its 95% confidence interval.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    if n <= 0 or samples <= 0:
+        return 0.0, 0.0, 0.0
+    distances = haversine_distances if world_coords else euclidean_distances
+    rng = np.random.default_rng(seed)
+    d = distances(coords[rng.integers(0, n, samples)], coords[rng.integers(0, n, samples)])
+    # Independent draws hit each pair i < j twice as often as each pair i = i,
+    # hence scale the sample mean by n / (n + 1) to estimate the average over i <= j
+    scale = n / (n + 1)
+    error = 1.96 * float(d.std(ddof=1)) / math.sqrt(samples) if samples > 1 else math.inf
+    return 0.0, scale * float(d.mean()), scale * error
+
+
+def bounding_box(groups: list) -> types.BoundingBox:
+    """
+    Calculates the bounding box of the given position arrays or groups
+    (see types.PositionArray and types.PositionGroup) from their cached bounds.
     """
     # Determine size
-    pos_x = [p[0] for pl in points for p in pl]
-    pos_y = [p[1] for pl in points for p in pl]
-    return types.BoundingBox(min(pos_x), max(pos_x), min(pos_y), max(pos_y))
+    bounds = np.concatenate([g.bounds() for g in groups])
+    bounds = bounds[~np.isnan(bounds[:, 0])]
+    if len(bounds) <= 0:
+        raise Exception("cannot determine bounding box of empty point set")
+    return types.BoundingBox(
+        float(bounds[:, 0].min()),
+        float(bounds[:, 1].max()),
+        float(bounds[:, 2].min()),
+        float(bounds[:, 3].max()),
+    )
 
 
 def create_map(lon: float, lat: float, custom_layers: list[str] = None) -> tuple[folium.Map, dict[str, any]]:
@@ -392,6 +1032,384 @@ def create_map(lon: float, lat: float, custom_layers: list[str] = None) -> tuple
     return m, base_tree
 
 
+# ==================== Plotly handling
+
+
+def write_html(fig: go.Figure, plot_file: str, plotly_js: str = PLOTLY_JS_INLINE):
+    """
+    Writes the given figure to an html file. plotly.js is either embedded (inline),
+    shared next to the file (directory) or written once to the given asset directory
+    and referenced from there.
+    """
+    if plotly_js == PLOTLY_JS_INLINE:
+        fig.write_html(plot_file)
+        return
+    if plotly_js == PLOTLY_JS_DIRECTORY:
+        fig.write_html(plot_file, include_plotlyjs="directory")
+        return
+    # Write the bundle to the asset directory (once per plotly.js version)
+    bundle = os.path.join(plotly_js, f"plotly-{plotly.offline.get_plotlyjs_version()}.min.js")
+    if not os.path.exists(bundle):
+        os.makedirs(plotly_js, exist_ok=True)
+        # Write to a temporary file first, as concurrent runs may share the asset directory
+        temp = f"{bundle}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(plotly.offline.get_plotlyjs())
+        os.replace(temp, bundle)
+    src = os.path.relpath(bundle, os.path.dirname(os.path.abspath(plot_file)))
+    fig.write_html(plot_file, include_plotlyjs=src.replace(os.sep, "/"))
+
+
+def scatter_type(plot_renderer: types.PlotRenderer = types.PlotRenderer.svg) -> type:
+    """
+    Returns the plotly scatter trace type for the given renderer.
+    """
+    return go.Scattergl if plot_renderer == types.PlotRenderer.webgl else go.Scatter
+
+
+def line_traces(
+    lines: list[np.ndarray],
+    colors: list[str],
+    ids: list[int],
+    label: str,
+    width: float,
+    fill: str = None,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+) -> list[go.Scatter]:
+    """
+    Packs the given (n, 2) lines into one NaN-separated trace per color (plotly only
+    supports one line color per trace). Hovering a point shows the label and id of its
+    line. If fill is given, each line is filled separately (e.g., "toself" for polygons).
+    """
+    by_color = {}
+    for line, color, group_id in zip(lines, colors, ids, strict=True):
+        by_color.setdefault(color, []).append((line, group_id))
+    scatter, traces = scatter_type(plot_renderer), []
+    for color, group in by_color.items():
+        coords = np.concatenate([part for line, _ in group for part in (line, np.full((1, 2), np.nan))])
+        group_ids = np.repeat([group_id for _, group_id in group], [len(line) + 1 for line, _ in group])
+        traces.append(
+            scatter(
+                x=coords[:, 0],
+                y=coords[:, 1],
+                mode="lines",
+                line={"color": color, "width": width},
+                customdata=group_ids,
+                hovertemplate=f"{label} %{{customdata}}<br>(%{{x}}, %{{y}})<extra></extra>",
+                fill=fill,
+            )
+        )
+    return traces
+
+
+def marker_trace(
+    points: list[np.ndarray],
+    colors: list[str],
+    ids: list[int],
+    label: str,
+    size: float,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+) -> go.Scatter:
+    """
+    Packs the given (n, 2) point groups into a single marker trace. Per-point colors are
+    given as indices into a stepped colorscale of the distinct colors (numeric arrays are
+    much cheaper for plotly than arrays of color strings). Hovering a point shows the
+    label and id of its group.
+    """
+    sizes = [len(p) for p in points]
+    coords = np.concatenate([np.asarray(p).reshape(-1, 2) for p in points] + [np.empty((0, 2))])
+    palette, indices = np.unique(np.array(colors, dtype=str), return_inverse=True)
+    top = max(len(palette) - 1, 1)
+    colorscale = [[i / top, c] for i, c in enumerate(palette.tolist())]
+    if len(palette) == 1:
+        colorscale.append([1.0, palette[0]])
+    return scatter_type(plot_renderer)(
+        x=coords[:, 0],
+        y=coords[:, 1],
+        mode="markers",
+        marker={
+            "color": np.repeat(indices, sizes),
+            "colorscale": colorscale,
+            "cmin": 0,
+            "cmax": top,
+            "size": size,
+        },
+        customdata=np.repeat(np.asarray(ids, dtype=np.int64), sizes),
+        hovertemplate=f"{label} %{{customdata}}<br>(%{{x}}, %{{y}})<extra></extra>",
+    )
+
+
+# ==================== Image export
+
+# Kaleido renderers of the process (started once, reused for all images written by the process)
+IMAGE_RENDERERS = []
+IMAGE_RENDERERS_LOCK = threading.Lock()
+
+
+@dataclasses.dataclass
+class ImageJob:
+    fig: go.Figure
+    file: str
+    width: float = None
+    height: float = None
+    scale: float = None
+
+
+def image_renderer(index: int = 0):
+    """
+    Returns the index-th kaleido renderer of the process, creating renderers up to it
+    as needed. The first one is plotly's own renderer (also used by fig.write_image).
+    Renderers are started on first use and kept alive until the process exits.
+    """
+    with IMAGE_RENDERERS_LOCK:
+        while len(IMAGE_RENDERERS) <= index:
+            if plotly.io.kaleido.scope is None:
+                raise Exception("image export requires the kaleido package (pip install kaleido)")
+            if not IMAGE_RENDERERS:
+                IMAGE_RENDERERS.append(plotly.io.kaleido.scope)
+                atexit.register(stop_image_renderers)
+                continue
+            base = IMAGE_RENDERERS[0]
+            IMAGE_RENDERERS.append(type(base)(plotlyjs=base.plotlyjs, mathjax=base.mathjax))
+        return IMAGE_RENDERERS[index]
+
+
+def warm_up_renderer(index: int = 0):
+    """
+    Starts the index-th kaleido renderer by exporting an empty figure.
+    """
+    image_renderer(index).transform({"data": [], "layout": {}}, format="png", width=10, height=10)
+
+
+def start_image_renderers(count: int = 1):
+    """
+    Starts the given number of kaleido renderers in the background, such that their
+    startup overlaps with the preparation of the figures. Renderers already created
+    by the process are reused as they are.
+    """
+    if plotly.io.kaleido.scope is None:
+        return  # Reported when writing the image
+    for index in range(len(IMAGE_RENDERERS), count):
+        threading.Thread(target=warm_up_renderer, args=(index,), daemon=True).start()
+
+
+def stop_image_renderers():
+    """
+    Shuts down all kaleido renderers of the process (registered to run at exit).
+    """
+    with IMAGE_RENDERERS_LOCK:
+        for renderer in IMAGE_RENDERERS:
+            renderer._shutdown_kaleido()
+
+
+def export_image(job: ImageJob, index: int = 0) -> float:
+    """
+    Writes the image of the given job using the index-th renderer and returns the
+    time it took (in seconds). The format is determined by the file extension.
+    """
+    start = time.perf_counter()
+    extension = os.path.splitext(job.file)[1].lstrip(".").lower()
+    image = image_renderer(index).transform(
+        job.fig.to_dict(),
+        format=extension if extension else None,
+        width=job.width,
+        height=job.height,
+        scale=job.scale,
+    )
+    with open(job.file, "wb") as f:
+        f.write(image)
+    return time.perf_counter() - start
+
+
+def write_images(jobs: list[ImageJob], workers: int = 1, verbose: bool = False) -> list[float]:
+    """
+    Writes the images of the given jobs, exporting up to workers figures in parallel
+    (one renderer per worker). Returns the export time of each image (in seconds),
+    which is also printed, if verbose.
+    """
+    count = max(1, min(workers, len(jobs)))
+    free = queue.SimpleQueue()
+    for index in range(count):
+        free.put(index)
+
+    def export(job: ImageJob) -> float:
+        index = free.get()
+        try:
+            return export_image(job, index)
+        finally:
+            free.put(index)
+
+    if count <= 1:
+        durations = [export(job) for job in jobs]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(count) as pool:
+            durations = list(pool.map(export, jobs))
+    if verbose:
+        for job, duration in zip(jobs, durations, strict=True):
+            print(f"Image export of {job.file}: {duration:.2f}s")
+    return durations
+
+
+def write_image(
+    fig: go.Figure,
+    file: str,
+    width: float = None,
+    height: float = None,
+    scale: float = None,
+    verbose: bool = False,
+) -> float:
+    """
+    Writes the image of the given figure (see write_images).
+    """
+    return write_images([ImageJob(fig, file, width, height, scale)], verbose=verbose)[0]
+
+
+# ==================== Output selection
+
+# Output artifacts (selectable with --outputs)
+OUTPUT_PLOT, OUTPUT_IMAGE, OUTPUT_MAP, OUTPUT_STATS = "plot", "image", "map", "stats"
+OUTPUTS = (OUTPUT_PLOT, OUTPUT_IMAGE, OUTPUT_MAP, OUTPUT_STATS)
+
+# Stages of the plotting pipeline (modes only run the stages that apply to them)
+STAGE_PARSE = "parse"  # reading and preprocessing the input
+STAGE_ENRICH = "enrich"  # road geometry of routes (osrm/routingkit)
+STAGE_SIMPLIFY = "simplify"  # simplification of the road geometry
+STAGE_HULLS = "hulls"  # convex hulls of clusters
+STAGE_METRICS = "metrics"  # cluster metrics (diameter, centroid, nearest centroids)
+STAGE_STATS = "stats"  # statistics (logged and written to the stats file)
+STAGE_COLORS = "colors"  # colors of the groups
+STAGE_FIGURE = "figure"  # plotly figure (interactive plot and kaleido image)
+STAGE_RASTER = "raster"  # raster image
+STAGE_MAP = "map"  # folium map
+
+# Stages each stage depends on
+STAGE_DEPENDENCIES = {
+    STAGE_PARSE: (),
+    STAGE_ENRICH: (STAGE_PARSE,),
+    STAGE_SIMPLIFY: (STAGE_ENRICH,),
+    STAGE_HULLS: (STAGE_PARSE,),
+    STAGE_METRICS: (STAGE_HULLS,),
+    STAGE_STATS: (STAGE_ENRICH, STAGE_METRICS),
+    STAGE_COLORS: (STAGE_PARSE,),
+    STAGE_FIGURE: (STAGE_COLORS, STAGE_SIMPLIFY, STAGE_HULLS),
+    STAGE_RASTER: (STAGE_COLORS, STAGE_SIMPLIFY, STAGE_HULLS),
+    STAGE_MAP: (STAGE_COLORS, STAGE_SIMPLIFY, STAGE_METRICS),
+}
+
+
+def output_list(value: str) -> list[str]:
+    """
+    Parses a comma-separated list of output artifacts (type of the --outputs argument).
+    """
+    outputs = [o.strip() for o in value.split(",") if o.strip()]
+    for output in outputs:
+        if output not in OUTPUTS:
+            raise argparse.ArgumentTypeError(f"invalid output: {output} (choose from {', '.join(OUTPUTS)})")
+    return outputs
+
+
+def required_stages(
+    outputs: list[str],
+    image_backend: types.ImageBackend = types.ImageBackend.kaleido,
+) -> set[str]:
+    """
+    Returns all stages needed to produce the given output artifacts.
+    """
+    image_stage = STAGE_RASTER if image_backend == types.ImageBackend.raster else STAGE_FIGURE
+    targets = {OUTPUT_PLOT: STAGE_FIGURE, OUTPUT_IMAGE: image_stage, OUTPUT_MAP: STAGE_MAP, OUTPUT_STATS: STAGE_STATS}
+    stages, pending = set(), [targets[o] for o in outputs]
+    while pending:
+        stage = pending.pop()
+        if stage not in stages:
+            stages.add(stage)
+            pending.extend(STAGE_DEPENDENCIES[stage])
+    return stages
+
+
+# ==================== Output writing
+
+OUTPUT_WORKERS = 3  # number of output artifacts written concurrently (interactive plot, image, map)
+
+
+class OutputWriter:
+    """
+    Writes output artifacts concurrently. Every artifact is written to a temporary
+    file first and moved into place once complete, so a failing writer leaves the
+    other artifacts (and the previous version of its own file) intact. Use it as a
+    context manager: leaving the block waits for all artifacts (see wait), or, on
+    error, cancels the pending ones and waits for the running ones to finish.
+    If renderer is set, the kaleido renderer is started along with the writer (it
+    stays alive for later images of the process, see start_image_renderers).
+    """
+
+    def __init__(self, verbose: bool = False, workers: int = OUTPUT_WORKERS, renderer: bool = False):
+        self.verbose = verbose
+        self.start = time.perf_counter()
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.outputs = []
+        if renderer:
+            start_image_renderers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            return False
+        self.wait()
+        return False
+
+    def submit(self, name: str, file: str, write):
+        """
+        Starts writing an artifact by calling write with the (temporary) file to write to.
+        """
+        self.outputs.append((name, file, self.pool.submit(self.run, file, write)))
+
+    @staticmethod
+    def run(file: str, write) -> float:
+        """
+        Writes a single artifact and returns the time it took (in seconds).
+        """
+        start = time.perf_counter()
+        # Write special files (e.g., /dev/stdout) directly, they cannot be replaced
+        if os.path.exists(file) and not os.path.isfile(file):
+            write(file)
+            return time.perf_counter() - start
+        # Keep the extension, it determines the format of some writers
+        root, extension = os.path.splitext(file)
+        temp = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+        try:
+            write(temp)
+            if os.path.exists(file):
+                # Keep the permissions of the file being replaced
+                shutil.copymode(file, temp)
+            os.replace(temp, file)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return time.perf_counter() - start
+
+    def wait(self):
+        """
+        Waits for all artifacts to be written and prints a timing summary, if verbose.
+        Raises an exception naming the failed artifacts, if any.
+        """
+        self.pool.shutdown(wait=True)
+        failed = []
+        for name, file, future in self.outputs:
+            error = future.exception()
+            if error is not None:
+                print(f"Error writing {name} to {file}: {error}")
+                failed.append(name)
+            elif self.verbose:
+                print(f"Output {name} ({file}): {future.result():.2f}s")
+        if self.verbose:
+            print(f"Outputs written in {time.perf_counter() - self.start:.2f}s")
+        if failed:
+            raise Exception(f"failed to write outputs: {', '.join(failed)}")
+
+
 # ==================== Color handling
 
 
@@ -423,41 +1441,81 @@ CLOUD_COLORS = [
 def range_step(start: float, end: float, value: float) -> float:
     """
     Puts a fractional value [0,1] between start and end, i.e., 0 will be equal to start and 1 to end.
+    Works on scalars and arrays alike.
     """
-    if start < end:
-        return start + (end - start) * value
-    else:
-        return start - (start - end) * value
+    return np.where(start < end, start + (end - start) * value, start - (start - end) * value)
+
+
+def round_digits(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    Rounds the given values to the given number of digits exactly like Python's round
+    (falls back to it for values close to a tie).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 10**digits
+    rounded = np.round(values, digits)
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(v, digits) for v in values[ties].tolist()]
+    return rounded
+
+
+def hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    """
+    Converts the given (n, 3) HSV colors (hue 0-360, saturation and value 0-1) to
+    RGB (0-255) the same way colorutils does.
+    """
+    h, s, v = hsv[:, 0] / 60, hsv[:, 1], hsv[:, 2]
+    if np.any(h >= 6):
+        raise Exception("Unable to convert from HSV to RGB")
+    c = v * s
+    x = c * (1 - np.abs((h % 2) - 1))
+    zero = np.zeros_like(c)
+    sector = np.clip(np.floor(h), 0, 5).astype(np.int64)[:, None]
+    rgb = np.choose(
+        sector,
+        [
+            np.stack([c, x, zero], axis=1),
+            np.stack([x, c, zero], axis=1),
+            np.stack([zero, c, x], axis=1),
+            np.stack([zero, x, c], axis=1),
+            np.stack([x, zero, c], axis=1),
+            np.stack([c, zero, x], axis=1),
+        ],
+    )
+    return round_digits((rgb + (v - c)[:, None]) * 255, 3)
+
+
+def to_colors(rgb: np.ndarray) -> tuple[types.Color, ...]:
+    """
+    Converts the given (n, 3) RGB array to colors (computing each hex string once).
+    Integer RGB values are kept as integers.
+    """
+    channels = np.trunc(rgb).astype(np.int64)
+    return tuple(
+        types.Color(rgb=tuple(values), hex="#{:02x}{:02x}{:02x}".format(*c))
+        for values, c in zip(rgb.tolist(), channels.tolist(), strict=True)
+    )
 
 
-def gradient(start: colorutils.Color, end: colorutils.Color, count: int) -> list[str]:
+def gradient(start: np.ndarray, end: np.ndarray, count: int) -> np.ndarray:
     """
-    Returns a gradient from start to end color (including both ends)
+    Returns a gradient from start to end RGB color (including both ends) as (count, 3) array.
     """
     if count <= 0:
-        return []
+        return np.empty((0, 3))
     elif count == 1:
-        return start
-    else:
-        return [
-            colorutils.Color(
-                rgb=(
-                    range_step(start.rgb[0], end.rgb[0], i / (count - 1)),
-                    range_step(start.rgb[1], end.rgb[1], i / (count - 1)),
-                    range_step(start.rgb[2], end.rgb[2], i / (count - 1)),
-                )
-            )
-            for i in range(count)
-        ]
+        return np.array([start])
+    steps = (np.arange(count) / (count - 1))[:, None]
+    return range_step(np.asarray(start)[None, :], np.asarray(end)[None, :], steps)
 
 
-def multi_gradient(colors: list[colorutils.Color], count: int) -> list[str]:
+def multi_gradient(colors: np.ndarray, count: int) -> np.ndarray:
     """
-    Creates a gradient across the given colors and returns as many colors as defined by count.
+    Creates a gradient across the given (k, 3) RGB colors and returns as many colors as defined by count.
     """
     # # If count is smaller than provided colors, simply enumerate the colors
     if count < len(colors):
-        return [colors[i] for i in range(count)]
+        return np.asarray(colors[:count])
 
     # Determine number of colors per gradient sections
     gradient_count = len(colors) - 1
@@ -479,10 +1537,10 @@ def multi_gradient(colors: list[colorutils.Color], count: int) -> list[str]:
         # Note: to have more accurate transitions, omit the start of the range and leave
         # it to the previous range (except for the first one)
         if c == 0:
-            multi.extend(list(gradient(colors[c], colors[c + 1], count)))
+            multi.append(gradient(colors[c], colors[c + 1], count))
         else:
-            multi.extend(list(gradient(colors[c], colors[c + 1], count + 1))[1:])
-    return multi
+            multi.append(gradient(colors[c], colors[c + 1], count + 1)[1:])
+    return np.concatenate(multi)
 
 
 def prepare_colors(point_groups, color_profile, sort_colors):
@@ -495,25 +1553,18 @@ def prepare_colors(point_groups, color_profile, sort_colors):
     color_sorting = list(range(len(point_groups)))
     if sort_colors:
         # Calculate centroids of all point groups
-        for pg in point_groups:
-            if len(pg.points) <= 0:
-                continue  # Skip empty groups
-            xs, ys = [p.lon for p in pg.points], [p.lat for p in pg.points]
-            pg.centroid = (sum(xs) / len(xs), sum(ys) / len(ys))
-        # Calculate centroid of all group centroids
-        xs, ys = (
-            [r.centroid[0] for r in point_groups if hasattr(r, "centroid")],
-            [r.centroid[1] for r in point_groups if hasattr(r, "centroid")],
-        )
-        centroid = (sum(xs) / len(xs), sum(ys) / len(ys))
-        # Handle empty groups by cloning the group centroid for them
-        for pg in filter(lambda p: not hasattr(p, "centroid"), point_groups):
-            pg.centroid = centroid
-        # Sort colors for groups clockwise by group centroids
-        color_sorting = sorted(
-            color_sorting,
-            key=lambda i: cw_angle_distance(centroid, point_groups[i].centroid),
-        )
+        centroids = group_centroids(point_groups)
+        filled = ~np.isnan(centroids[:, 0])
+        if np.any(filled):
+            # Calculate centroid of all group centroids
+            centroid = centroids[filled].mean(axis=0)
+            # Handle empty groups by cloning the group centroid for them
+            centroids[~filled] = centroid
+            for pg, c in zip(point_groups, centroids.tolist(), strict=True):
+                pg.centroid = tuple(c)
+            # Sort colors for groups clockwise by group centroids
+            angles, distances = cw_angles_distances(centroid, centroids)
+            color_sorting = np.lexsort((distances, angles)).tolist()
 
     # Generate sufficient number of colors
     colors = get_colors(color_profile, len(color_sorting))
@@ -525,36 +1576,46 @@ def prepare_colors(point_groups, color_profile, sort_colors):
         i += 1
 
 
-def get_colors(color_profile: str, count: int) -> list[colorutils.Color]:
+def get_colors(color_profile: str, count: int) -> list[types.Color]:
     """
     Generates a set of colors according to the provided color profile.
     """
+    return list(palette(color_profile, count))
+
+
+@functools.cache
+def palette(color_profile: str, count: int) -> tuple[types.Color, ...]:
+    """
+    Generates the colors of the given color profile (memoized per profile and count).
+    """
     # Generate colors to use (according to profile)
     if color_profile == types.ColorProfile.auto.value:
         if count > len(CLOUD_COLORS):
             color_profile = types.ColorProfile.rainbow.value
         else:
             color_profile = types.ColorProfile.cloud.value
-    colors = [colorutils.Color(hsv=(188.0, 0.44, 0.46))]
+    indices = np.arange(count)
     if color_profile == types.ColorProfile.cloud.value:
-        colors = CLOUD_COLORS
+        return to_colors(np.array([c.rgb for c in CLOUD_COLORS]))
     elif color_profile == types.ColorProfile.rainbow.value:
-        colors = [colorutils.Color(hsv=((i / count * 360.0), 0.8, 0.8)) for i in range(count)]
+        hues = indices / max(count, 1) * 360.0
+        return to_colors(hsv_to_rgb(np.stack([hues, np.full(count, 0.8), np.full(count, 0.8)], axis=1)))
     else:
         elements = color_profile.split(",")
         if elements[0].startswith("rainbow"):
             start, end, sat, val = (float(v) for v in elements[1:5])
             rng = (end - start) if start < end else (start - end)
-            step = rng / count
-            colors = [colorutils.Color(hsv=((start + i * step % 360.0), sat, val)) for i in range(count)]
+            step = rng / max(count, 1)
+            hues = start + indices * step % 360.0
+            return to_colors(hsv_to_rgb(np.stack([hues, np.full(count, sat), np.full(count, val)], axis=1)))
         elif elements[0].startswith("gradient"):
             grad_colors = elements[1:]
             if len(grad_colors) < 2:
-                raise f"at least 2 colors are required for gradient mode (got {len(grad_colors)})"
-            colors = multi_gradient([colorutils.Color(hex=c) for c in grad_colors], count)
+                raise Exception(f"at least 2 colors are required for gradient mode (got {len(grad_colors)})")
+            rgb = np.array([colorutils.Color(hex=c).rgb for c in grad_colors])
+            return to_colors(multi_gradient(rgb, count))
         else:
             raise Exception(f"Invalid color profile {color_profile}")
-    return colors
 
 
 def get_color(h: float, s: float, v: float) -> str:
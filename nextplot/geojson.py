@@ -1,7 +1,6 @@
 import json
 
 import folium
-import jsonpath_ng
 from folium import plugins
 from folium.elements import JSCSSMixin
 from folium.map import Layer
@@ -104,14 +103,14 @@ def parse(
     Parses the geojson data object(s) from the file(s).
     """
     # Load json data
-    content_geojson, _ = common.load_data(input_geojson, "")
+    document, _ = common.load_data(input_geojson, "")
 
     # Extract geojsons
     if jpath_geojson:
-        expression = jsonpath_ng.parse(jpath_geojson)
-        geojsons = [json.loads(match.value) for match in expression.find(content_geojson)]
+        matches = [match.value for match in document.find(jpath_geojson)]
+        geojsons = [json.loads(m) if isinstance(m, str) else m for m in matches]
     else:
-        geojsons = [json.loads(content_geojson)]
+        geojsons = [document.data()]
 
     return geojsons
 
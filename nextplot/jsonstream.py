@@ -0,0 +1,346 @@
+import collections
+import json
+import re
+import sys
+
+from . import common
+
+# ==================== This file contains streaming JSON ingestion code
+
+CHUNK_SIZE = 1 << 20  # read input in chunks of 1 MiB
+
+# Regular expressions used for scanning the raw JSON text
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+STRUCTURE = re.compile(r'[\[\]{}"]')
+SCALAR_END = re.compile(r"[,\]}\s]")
+DECODER = json.JSONDecoder()
+
+
+class PathState:
+    """
+    Tracks the progress of one JSON path while walking the document.
+    Matches are collected in the given sink.
+    """
+
+    __slots__ = ("expr", "step", "indices", "sink")
+
+    def __init__(self, expr: common.SimpleJsonPath, step: int, indices: tuple[int, ...], sink: list):
+        self.expr = expr
+        self.step = step
+        self.indices = indices
+        self.sink = sink
+
+    def next_step(self):
+        """
+        Returns the next step of the path or None, if the path is complete.
+        """
+        return self.expr.steps[self.step] if self.step < len(self.expr.steps) else None
+
+    def advance(self, indices: tuple[int, ...] = None, sink: list = None):
+        """
+        Returns the state for the next step of the path.
+        """
+        return PathState(
+            self.expr,
+            self.step + 1,
+            self.indices if indices is None else indices,
+            self.sink if sink is None else sink,
+        )
+
+
+class JsonScanner:
+    """
+    Walks the JSON text read from a file object chunk by chunk. Values not
+    addressed by any path are skipped without being decoded, only matched
+    values are materialized.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.buf = ""
+        self.pos = 0
+        self.mark = None
+        self.eof = False
+
+    def fill(self) -> bool:
+        """
+        Reads the next chunk of the input. Returns false, if the input is exhausted.
+        """
+        if self.eof:
+            return False
+        # Grow reads geometrically while a large value is pinned to keep copying linear
+        size = CHUNK_SIZE if self.mark is None else max(CHUNK_SIZE, len(self.buf) - self.mark)
+        chunk = self.file.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop everything already consumed (and not pinned by a mark)
+        cut = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[cut:] + chunk
+        self.pos -= cut
+        if self.mark is not None:
+            self.mark -= cut
+        return True
+
+    def error(self, msg: str):
+        """
+        Raises an error for the current position.
+        """
+        raise Exception(f"invalid JSON input ({msg}) near: {self.buf[self.pos:self.pos + 40]}")
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character (empty at the end of the input).
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        """
+        Consumes the given character.
+        """
+        if self.peek() != char:
+            self.error(f"expected '{char}'")
+        self.pos += 1
+
+    def skip_string(self):
+        """
+        Skips the string starting at the current position.
+        """
+        while True:
+            m = STRING.match(self.buf, self.pos)
+            if m is not None:
+                self.pos = m.end()
+                return
+            if not self.fill():
+                self.error("unterminated string")
+
+    def skip_value(self):
+        """
+        Skips the value starting at the current position.
+        """
+        c = self.peek()
+        if c == '"':
+            self.skip_string()
+        elif c in ("[", "{"):
+            depth = 0
+            while True:
+                m = STRUCTURE.search(self.buf, self.pos)
+                if m is None:
+                    self.pos = len(self.buf)
+                    if not self.fill():
+                        self.error("unexpected end of input")
+                    continue
+                char = m.group()
+                if char == '"':
+                    self.pos = m.start()
+                    self.skip_string()
+                    continue
+                self.pos = m.end()
+                depth += 1 if char in ("[", "{") else -1
+                if depth == 0:
+                    return
+        elif c:
+            while True:
+                m = SCALAR_END.search(self.buf, self.pos)
+                if m is not None:
+                    self.pos = m.start()
+                    return
+                if not self.fill():
+                    self.pos = len(self.buf)
+                    return
+        else:
+            self.error("unexpected end of input")
+
+    def read_value(self):
+        """
+        Materializes the value starting at the current position.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # The value may continue in the next chunk
+                self.mark = self.pos
+                more = self.fill()
+                self.mark = None
+                if more:
+                    continue
+                raise
+            # Numbers may continue in the next chunk, too
+            if end == len(self.buf) and not self.eof and self.buf[self.pos] not in ('"', "[", "{"):
+                self.mark = self.pos
+                self.fill()
+                self.mark = None
+                continue
+            self.pos = end
+            return value
+
+    def read_key(self) -> str:
+        """
+        Reads an object key (including the subsequent colon).
+        """
+        if self.peek() != '"':
+            self.error("expected object key")
+        self.mark = self.pos
+        self.skip_string()
+        start, self.mark = self.mark, None
+        raw = self.buf[start : self.pos]
+        key = raw[1:-1] if "\\" not in raw else json.loads(raw)
+        self.expect(":")
+        return key
+
+    def walk(self, states: list[PathState]):
+        """
+        Processes the next value for the given path states.
+        """
+        if not states:
+            self.skip_value()
+            return
+        # Determine whether all paths can continue inside the container
+        c = self.peek()
+        descend = c in ("[", "{")
+        for state in states:
+            step = state.next_step()
+            if step is None or (step[0] == common.STEP_FIELD) != (c == "{"):
+                descend = False
+                break
+        # Materialize the value and evaluate the remaining steps in memory
+        if not descend:
+            value = self.read_value()
+            for state in states:
+                state.sink.extend(state.expr.find_at(value, state.step, state.indices))
+            return
+        if c == "{":
+            self.walk_object(states)
+        else:
+            self.walk_array(states)
+
+    def walk_object(self, states: list[PathState]):
+        """
+        Walks the object at the current position.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_key()
+            self.walk([s.advance() for s in states if s.next_step()[1] == key])
+            c = self.peek()
+            self.pos += 1
+            if c == "}":
+                return
+            if c != ",":
+                self.pos -= 1
+                self.error("expected ',' or '}'")
+
+    def walk_array(self, states: list[PathState]):
+        """
+        Walks the array at the current position. Elements addressed by negative
+        indices are only known at the end of the array, hence, the matches of
+        the last candidates are kept aside until then.
+        """
+        self.expect("[")
+        pending = {}
+        for state in states:
+            kind, arg = state.next_step()
+            if kind == common.STEP_INDEX and arg < 0:
+                pending[state] = collections.deque(maxlen=-arg)
+        length = 0
+        if self.peek() == "]":
+            self.pos += 1
+        else:
+            while True:
+                substates = []
+                for state in states:
+                    kind, arg = state.next_step()
+                    if kind == common.STEP_ALL:
+                        substates.append(state.advance(indices=(*state.indices, length)))
+                    elif arg == length:
+                        substates.append(state.advance())
+                    elif arg < 0:
+                        candidate = []
+                        pending[state].append(candidate)
+                        substates.append(state.advance(sink=candidate))
+                self.walk(substates)
+                length += 1
+                c = self.peek()
+                self.pos += 1
+                if c == "]":
+                    break
+                if c != ",":
+                    self.pos -= 1
+                    self.error("expected ',' or ']'")
+        # Resolve negative indices
+        for state, candidates in pending.items():
+            _, arg = state.next_step()
+            if -arg <= length:
+                state.sink.extend(candidates[0])
+
+
+def find_all(file, jpaths: list[str]) -> dict[str, list]:
+    """
+    Evaluates all given JSON paths in a single pass over the JSON read from
+    the given file object. Returns the matches per path.
+    """
+    exprs = {jpath: common.parse_jpath(jpath) for jpath in jpaths if jpath}
+    results = {jpath: [] for jpath in exprs}
+    scanner = JsonScanner(file)
+    scanner.walk([PathState(expr, 0, (), results[jpath]) for jpath, expr in exprs.items()])
+    if scanner.peek():
+        scanner.error("unexpected trailing data")
+    return results
+
+
+class StreamedDocument:
+    """
+    A JSON input that is evaluated incrementally. All JSON paths used on the
+    input are evaluated in a single pass and only the values they match are
+    materialized. Inputs with paths that are not plain dotted paths are
+    loaded completely instead.
+    """
+
+    def __init__(self, input: str, jpaths: list[str]):
+        jpaths = [jpath for jpath in dict.fromkeys(jpaths) if jpath]
+        unsupported = [jpath for jpath in jpaths if common.compile_simple_jpath(jpath) is None]
+        file = open(input) if input else sys.stdin
+        try:
+            if unsupported:
+                print(f"Warning! Cannot stream JSON paths {', '.join(unsupported)}, loading full input instead")
+                data = json.load(file)
+                self.matches = {jpath: common.parse_jpath(jpath).find(data) for jpath in jpaths}
+            else:
+                self.matches = find_all(file, jpaths)
+        finally:
+            if input:
+                file.close()
+
+    def find(self, jpath: str) -> list:
+        """
+        Returns the matches of the given JSON path.
+        """
+        return self.matches[jpath]
+
+
+def load_data(
+    input_groups: str,
+    jpaths_groups: list[str],
+    input_positions: str,
+    jpaths_positions: list[str],
+) -> tuple[StreamedDocument, StreamedDocument]:
+    """
+    Streams the location and position data, evaluating the given JSON paths.
+    Mirrors common.load_data, i.e., positions are read from the group input,
+    if no separate position input is given.
+    """
+    if input_positions:
+        return StreamedDocument(input_groups, jpaths_groups), StreamedDocument(input_positions, jpaths_positions)
+    document = StreamedDocument(input_groups, jpaths_groups + jpaths_positions)
+    return document, document
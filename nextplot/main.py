@@ -92,6 +92,17 @@ def entry_point():
             custom_map_tile=args.custom_map_tile,
             plotly_theme=args.plotly_theme,
             nextroute=args.nextroute,
+            no_desc=args.no_desc,
+            stream=args.stream,
+            verbose=args.verbose,
+            float32=args.float32,
+            workers=args.workers,
+            plot_consolidated=args.plot_consolidated,
+            plot_renderer=args.plot_renderer,
+            plotly_js=args.plotly_js,
+            image_backend=args.image_backend,
+            outputs=args.outputs,
+            simplify=args.simplify,
         )
     elif args.command == MODE_CLUSTER:
         cluster.plot(
@@ -113,6 +124,16 @@ def entry_point():
             weight_points=args.weight_points,
             custom_map_tile=args.custom_map_tile,
             plotly_theme=args.plotly_theme,
+            no_desc=args.no_desc,
+            stream=args.stream,
+            verbose=args.verbose,
+            float32=args.float32,
+            workers=args.workers,
+            plot_consolidated=args.plot_consolidated,
+            plot_renderer=args.plot_renderer,
+            plotly_js=args.plotly_js,
+            image_backend=args.image_backend,
+            outputs=args.outputs,
         )
     elif args.command == MODE_POINT:
         point.plot(
@@ -133,6 +154,18 @@ def entry_point():
             weight_points=args.weight_points,
             custom_map_tile=args.custom_map_tile,
             plotly_theme=args.plotly_theme,
+            no_desc=args.no_desc,
+            stream=args.stream,
+            verbose=args.verbose,
+            float32=args.float32,
+            workers=args.workers,
+            plot_consolidated=args.plot_consolidated,
+            plot_renderer=args.plot_renderer,
+            plotly_js=args.plotly_js,
+            image_backend=args.image_backend,
+            outputs=args.outputs,
+            stats_memory=args.stats_memory,
+            stats_sample=args.stats_sample,
         )
     elif args.command == MODE_PROGRESSION:
         progression.plot(
@@ -150,6 +183,9 @@ def entry_point():
             legend_position=args.legend_position,
             weight=args.weight,
             nextroute=args.nextroute,
+            plot_renderer=args.plot_renderer,
+            plotly_js=args.plotly_js,
+            verbose=args.verbose,
         )
     elif args.command == MODE_GEOJSON:
         geojson.plot(
@@ -47,13 +47,13 @@ def query_route(
                 f"Warning: OSRM was unable to find a route for {[(p.lat, p.lon) for p in route.positions]}"
                 + "(lat,lon ordering), using as-the-crow-flies fallback"
             )
-            paths, distances, durations = [], [], []
+            paths = []
             for f, t in zip(route.positions, route.positions[1:], strict=False):
                 paths.append(
                     [types.Position(lon=f.lon, lat=f.lat, desc=None), types.Position(lon=t.lon, lat=t.lat, desc=None)]
                 )
-                distances.append(common.haversine(f, t))
-                durations.append(common.haversine(f, t) / TRAVEL_SPEED)
+            distances = common.haversine_consecutive(common.position_coords(route.positions)).tolist()
+            durations = [d / TRAVEL_SPEED for d in distances]
             return OsrmRouteResponse(paths=paths, distances=distances, durations=durations, no_route=True)
         # Make sure we are not getting an error
         response.raise_for_status()
@@ -88,16 +88,24 @@ def query_route(
         # Make sure we are finding any routes
         if distance > 0:
             all_zero_distances = False
-        # Add duration for start and end
-        start_distance = common.haversine(path[0], route.positions[idx])
-        end_distance = common.haversine(path[-1], route.positions[idx + 1])
-        distance += start_distance + end_distance
-        duration += start_distance / TRAVEL_SPEED + end_distance / TRAVEL_SPEED
         # Append to list
         legs.append(path)
         distances.append(distance)
         durations.append(duration)
 
+    # Add distance and duration for start and end of all legs
+    start_distances = common.haversine_distances(
+        common.position_coords([path[0] for path in legs]),
+        common.position_coords(route.positions[: len(legs)]),
+    ).tolist()
+    end_distances = common.haversine_distances(
+        common.position_coords([path[-1] for path in legs]),
+        common.position_coords(route.positions[1 : len(legs) + 1]),
+    ).tolist()
+    for idx, (start_distance, end_distance) in enumerate(zip(start_distances, end_distances, strict=True)):
+        distances[idx] += start_distance + end_distance
+        durations[idx] += start_distance / TRAVEL_SPEED + end_distance / TRAVEL_SPEED
+
     # Warn if number of legs does not match number of positions
     if len(legs) != len(route.positions) - 1:
         print(f"Warning: number of legs ({len(legs)}) does not match number of positions ({len(route.positions)} - 1)")
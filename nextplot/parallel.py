@@ -0,0 +1,137 @@
+import copy
+import multiprocessing
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# ==================== This file contains process pool execution of per-group and per-tile computations
+
+# Coordinates shared with the current worker process (see attach)
+WORKER_COORDS = None
+
+
+def attach(name: str, shape: tuple[int, int], dtype: str):
+    """
+    Attaches a worker process to the shared coordinates (used as pool initializer).
+    The block is owned (and unlinked) by the parent process, hence it is not tracked
+    by the worker. Otherwise, the worker's resource tracker may warn about the block
+    as leaked or even unlink it when the worker exits (before Python 3.13).
+    """
+    global WORKER_COORDS
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    WORKER_COORDS = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def run_task(call: tuple):
+    """
+    Runs one task on the shared coordinates of the worker process.
+    """
+    func, task, args = call
+    return func(WORKER_COORDS[1], task, *args)
+
+
+def run(func, coords: np.ndarray, tasks: list, workers: int, *args) -> list:
+    """
+    Runs func(coords, task, *args) for all tasks and returns the results in
+    task order. If more than one worker is requested, the tasks are distributed
+    across a process pool, with the coordinates being passed through shared
+    memory. func needs to be a module level function. The results do not depend
+    on the number of workers.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(coords, task, *args) for task in tasks]
+    coords = np.ascontiguousarray(coords)
+    shm = shared_memory.SharedMemory(create=True, size=max(coords.nbytes, 1))
+    try:
+        np.ndarray(coords.shape, dtype=coords.dtype, buffer=shm.buf)[:] = coords
+        with multiprocessing.Pool(
+            min(workers, len(tasks)),
+            initializer=attach,
+            initargs=(shm.name, coords.shape, coords.dtype.str),
+        ) as pool:
+            return pool.map(run_task, [(func, task, args) for task in tasks])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+SHARD_POINTS = 1 << 16  # min. number of points per shard of groups (see shards)
+
+
+def shards(sizes: list[int]) -> list[tuple[int, int]]:
+    """
+    Splits the groups of the given sizes into consecutive shards (as group ranges) of at
+    least SHARD_POINTS points each (the last one may be smaller). The shards only depend
+    on the group sizes, not on the number of workers.
+    """
+    ranges, start, points = [], 0, 0
+    for i, size in enumerate(sizes):
+        points += size
+        if points >= SHARD_POINTS:
+            ranges.append((start, i + 1))
+            start, points = i + 1, 0
+    if start < len(sizes):
+        ranges.append((start, len(sizes)))
+    return ranges
+
+
+def run_shard(groups: list[np.ndarray], group_args: list[tuple], func, accumulator, *args) -> tuple[list, object]:
+    """
+    Runs func on the given groups of one shard, feeding a copy of the given (empty)
+    accumulator. Returns the results along with the filled accumulator.
+    """
+    partial = copy.deepcopy(accumulator)
+    results = [func(g, *ga, partial, *args) for g, ga in zip(groups, group_args, strict=True)]
+    return results, partial
+
+
+def run_shard_task(coords: np.ndarray, task: tuple, func, accumulator, *args) -> tuple[list, object]:
+    """
+    Runs one shard (given by the spans and arguments of its groups) on the shared coordinates (see run_shard).
+    """
+    spans, group_args = task
+    return run_shard([coords[start:end] for start, end in spans], group_args, func, accumulator, *args)
+
+
+def reduce_groups(
+    func,
+    groups: list[np.ndarray],
+    workers: int,
+    accumulator,
+    *args,
+    group_args: list[tuple] = None,
+) -> tuple[list, object]:
+    """
+    Runs func(group, *group_arg, partial, *args) for all given (n, 2) coordinate arrays,
+    where func feeds its values into partial, the accumulator of the shard of the group
+    (see shards). Partials start as copies of the given (empty) accumulator and are merged
+    in shard order, so the results do not depend on the number of workers. Returns the
+    results of func in group order and the merged accumulator. group_args optionally
+    holds additional arguments per group.
+    """
+    groups = [np.asarray(g, dtype=np.float64).reshape(-1, 2) for g in groups]
+    if group_args is None:
+        group_args = [()] * len(groups)
+    ranges = shards([len(g) for g in groups])
+    if workers <= 1 or len(ranges) <= 1:
+        # Run inline on the given groups (no need to copy them into one array)
+        outputs = [run_shard(groups[s:e], group_args[s:e], func, accumulator, *args) for s, e in ranges]
+    else:
+        offsets = np.cumsum([0, *[len(g) for g in groups]]).tolist()
+        coords = np.concatenate(groups + [np.empty((0, 2))])
+        tasks = [(list(zip(offsets[s:e], offsets[s + 1 : e + 1], strict=True)), group_args[s:e]) for s, e in ranges]
+        outputs = run(run_shard_task, coords, tasks, workers, func, accumulator, *args)
+    results, merged = [], copy.deepcopy(accumulator)
+    for shard_results, partial in outputs:
+        results.extend(shard_results)
+        merged.merge(partial)
+    return results, merged
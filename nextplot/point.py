@@ -1,12 +1,11 @@
 import json
-import sys
-from collections.abc import Callable
 
 import folium
+import numpy as np
 import plotly.graph_objects as go
 from folium import plugins
 
-from . import common, types
+from . import common, jsonstream, raster, types
 
 # ==================== This file contains plain point plotting code (mode: 'point')
 
@@ -55,6 +54,21 @@ def arguments(parser):
         default=1,
         help="point size (<1 decreases, >1 increases)",
     )
+    parser.add_argument(
+        "--stats_memory",
+        type=float,
+        nargs="?",
+        default=common.PAIRWISE_MEMORY,
+        help="memory budget (in MB) for calculating the pairwise distance statistics",
+    )
+    parser.add_argument(
+        "--stats_sample",
+        type=int,
+        nargs="?",
+        default=0,
+        help="estimate the average pairwise distance from the given number of sampled pairs"
+        + " instead of calculating all of them (0 calculates all pairs)",
+    )
 
 
 # ==================== Point plotting specific functionality
@@ -67,12 +81,18 @@ def parse(
     jpath_pos: str,
     jpath_x: str,
     jpath_y: str,
-) -> tuple[list[list[types.Position]], list[list[types.Position]]]:
+    keep_desc: bool = True,
+    stream: bool = False,
+    float32: bool = False,
+) -> types.PositionArray:
     """
     Parses the point data from the file(s).
     """
     # Load json data
-    content_point, content_coordinate = common.load_data(input_point, input_pos)
+    if stream:
+        content_point, content_coordinate = jsonstream.load_data(input_point, [jpath_point], input_pos, [jpath_pos])
+    else:
+        content_point, content_coordinate = common.load_data(input_point, input_pos)
 
     # Extract points
     positions = common.extract_position_groups(
@@ -82,6 +102,8 @@ def parse(
         jpath_pos,
         jpath_x,
         jpath_y,
+        keep_desc,
+        np.float32 if float32 else np.float64,
     )
 
     return positions
@@ -105,13 +127,31 @@ def plot(
     weight_points: float,
     custom_map_tile: list[str],
     plotly_theme: str,
+    no_desc: bool = False,
+    stream: bool = False,
+    verbose: bool = False,
+    float32: bool = False,
+    stats_memory: float = common.PAIRWISE_MEMORY,
+    stats_sample: int = 0,
+    workers: int = 1,
+    plot_consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+    plotly_js: str = common.PLOTLY_JS_INLINE,
+    image_backend: types.ImageBackend = types.ImageBackend.kaleido,
+    outputs: list[str] = common.OUTPUTS,
 ):
     """
     Plots points based on the given arguments.
     Interprets args, reads .json, collects some stats,
     plots a .png and plots an interactive .html map.
+    Only the given outputs are produced, skipping all stages they do not need.
     """
 
+    # Determine the stages needed for the requested outputs
+    stages = common.required_stages(outputs, image_backend)
+    if common.STAGE_PARSE not in stages:
+        return
+
     # Determine base filename
     base_name = "plot"  # Default for STDIN
     if input_point:
@@ -125,7 +165,13 @@ def plot(
         jpath_pos,
         jpath_x,
         jpath_y,
+        not no_desc,
+        stream,
+        float32,
     )
+    if verbose:
+        common.print_jpath_cache_info()
+        common.print_document_info()
 
     # Quit on no points
     if len(positions) <= 0:
@@ -139,34 +185,124 @@ def plot(
         return
 
     # Determine bbox
-    bbox = common.bounding_box(positions)
+    bbox = common.bounding_box([positions])
 
     # Wrap in meta object
-    points = [types.Point(p) for p in positions]  # Wrap it
+    points = positions.wrap(types.Point)  # Wrap it
     if len(points) <= 0:
         print(f"no points could be extracted at the given path: {jpath_point}")
         return
 
-    measure = common.haversine if world_coords else common.euclidean
-
     # Enumerate point groups
     for i in range(len(points)):
         points[i].group = i + 1
 
     # Prepares colors for the points
-    common.prepare_colors(points, colors, sort_color)
+    if common.STAGE_COLORS in stages:
+        common.prepare_colors(points, colors, sort_color)
 
     # Dump some stats
-    statistics(points, measure, stats_file)
+    if common.STAGE_STATS in stages:
+        statistics(points, world_coords, stats_file, stats_memory, stats_sample, workers)
 
     # Make simple plot of points
     aspect_ratio = (bbox.height) / (bbox.width) if bbox.width > 0 else 1
 
+    # Determine image size
+    image_width = min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio)
+    image_height = min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio)
+
+    # Determine output files
+    plot_file = output_plot
+    if not plot_file and common.OUTPUT_PLOT in outputs:
+        plot_file = base_name + ".plot.html"
+        print(f"Plotting interactive plot to {plot_file}")
+    image_file = output_image
+    if not image_file and common.OUTPUT_IMAGE in outputs:
+        image_file = base_name + ".plot.png"
+        print(f"Plotting image to {image_file}")
+    map_file = output_map
+    if common.OUTPUT_MAP in outputs and not world_coords:
+        # Skip plotting on map, if no geo-coordinates
+        print("No world coordinates, skipping map plotting")
+    elif common.OUTPUT_MAP in outputs and not map_file:
+        map_file = base_name + ".map.html"
+        print(f"Plotting map to {map_file}")
+
+    # Write outputs concurrently (the map and raster image only need the finished point groups, start them right away)
+    # The kaleido renderer is only started if an image is requested (its startup overlaps with creating the figure)
+    kaleido_image = common.OUTPUT_IMAGE in outputs and image_backend == types.ImageBackend.kaleido
+    with common.OutputWriter(verbose, renderer=kaleido_image) as writer:
+        if common.STAGE_MAP in stages and world_coords:
+            writer.submit(
+                "map",
+                map_file,
+                lambda file: create_map(points, bbox, weight_points, custom_map_tile).save(file),
+            )
+        if common.STAGE_RASTER in stages:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: create_raster(points, weight_points, image_width, image_height, plotly_theme).save(file),
+            )
+
+        # Create figure
+        if common.STAGE_FIGURE in stages:
+            fig = create_plot(
+                points,
+                "lon" if world_coords else "x",
+                "lat" if world_coords else "y",
+                plotly_theme,
+                weight_points,
+                plot_consolidated,
+                plot_renderer,
+            )
+
+        # Save interactive plot and image
+        if common.OUTPUT_PLOT in outputs:
+            writer.submit("plot", plot_file, lambda file: common.write_html(fig, file, plotly_js))
+        if kaleido_image:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: common.write_image(fig, file, width=image_width, height=image_height),
+            )
+
+
+def create_raster(
+    points: list[types.Point],
+    weight_points: float,
+    width: float,
+    height: float,
+    plotly_theme: str,
+) -> raster.Canvas:
+    """
+    Draws the given point groups on a raster canvas in the trace order of create_plot.
+    """
+    canvas = raster.Canvas(width, height, *raster.template_colors(plotly_theme))
+    plotted = [pg for pg in points if len(pg.coords) > 0]
+    canvas.add_markers([pg.coords for pg in plotted], [pg.color.hex for pg in plotted], weight_points * 5)
+    return canvas
+
+
+def create_plot(
+    points: list[types.Point],
+    label_x: str,
+    label_y: str,
+    plotly_theme: str,
+    weight_points: float,
+    consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+) -> go.Figure:
+    """
+    Plots the given point groups on a plotly figure. If consolidated, all groups are
+    packed into a single trace (see common.marker_trace).
+    """
     # Init plot
     fig = go.Figure(
         layout=go.Layout(
-            xaxis_title="lon" if world_coords else "x",
-            yaxis_title="lat" if world_coords else "y",
+            xaxis_title=label_x,
+            yaxis_title=label_y,
             template=plotly_theme,
             margin={"l": 20, "r": 20, "b": 20, "t": 20, "pad": 4},
             font={"size": 18},
@@ -175,51 +311,47 @@ def plot(
     )
 
     # Plot points
-    for i, pg in enumerate(points):
-        if len(pg.points) <= 0:
-            continue
-        # Plot points
+    plotted = [(i, pg) for i, pg in enumerate(points) if len(pg.coords) > 0]
+    if consolidated:
         fig.add_trace(
-            go.Scatter(
-                x=[p.lon for p in pg.points],
-                y=[p.lat for p in pg.points],
-                mode="markers",
-                marker={
-                    "size": weight_points * 5,
-                    "color": pg.color.hex,
-                },
-                name=f"Group {i+1}",
+            common.marker_trace(
+                [pg.coords for _, pg in plotted],
+                [pg.color.hex for _, pg in plotted],
+                [i + 1 for i, _ in plotted],
+                "Group",
+                weight_points * 5,
+                plot_renderer,
             )
         )
+    else:
+        for i, pg in plotted:
+            # Plot points
+            fig.add_trace(
+                common.scatter_type(plot_renderer)(
+                    x=pg.coords[:, 0],
+                    y=pg.coords[:, 1],
+                    mode="markers",
+                    marker={
+                        "size": weight_points * 5,
+                        "color": pg.color.hex,
+                    },
+                    name=f"Group {i+1}",
+                )
+            )
 
-    # Save interactive plot
-    plot_file = output_plot
-    if not plot_file:
-        plot_file = base_name + ".plot.html"
-        print(f"Plotting interactive plot to {plot_file}")
-    fig.write_html(plot_file)
-
-    # Save plot image
-    image_file = output_image
-    if not image_file:
-        image_file = base_name + ".plot.png"
-        print(f"Plotting image to {image_file}")
-    fig.write_image(
-        image_file,
-        width=min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio),
-        height=min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio),
-    )
+    # Return figure
+    return fig
 
-    # Skip plotting on map, if no geo-coordinates
-    if not world_coords:
-        print("No world coordinates, skipping map plotting")
-        quit()
 
-    # Make map plot of routes
-    map_file = output_map
-    if not map_file:
-        map_file = base_name + ".map.html"
-        print(f"Plotting map to {map_file}")
+def create_map(
+    points: list[types.Point],
+    bbox: types.BoundingBox,
+    weight_points: float,
+    custom_map_tile: list[str],
+) -> folium.Map:
+    """
+    Plots the given point groups on a folium map.
+    """
     m, base_tree = common.create_map(
         (bbox.max_x + bbox.min_x) / 2.0,
         (bbox.max_y + bbox.min_y) / 2.0,
@@ -229,20 +361,19 @@ def plot(
     group_names = {}
 
     for i, ps in enumerate(points):
-        if len(ps.points) <= 0:
+        if len(ps.coords) <= 0:
             continue
         layer_name = f"Point group {i+1}"
         plot_groups[i] = folium.FeatureGroup(name=layer_name)
         group_names[plot_groups[i]] = layer_name
         for point in ps.points:
-            d = point.desc.replace("\n", "<br/>").replace(r"`", r"\`")
             popup_text = folium.Html(
                 "<p>"
                 + f"Location (lon/lat): {point[0]}, {point[1]}</br>"
                 + f"Group: {ps.group}</br>"
-                + f"Group size: {len(ps.points)}</br>"
+                + f"Group size: {len(ps.coords)}</br>"
                 + "</p>"
-                + f"JSON:</br><pre><code>{d}</code></pre></br>",
+                + common.desc_html(point),
                 script=True,
             )
             popup = folium.Popup(popup_text, max_width=450, sticky=True)
@@ -288,44 +419,46 @@ def plot(
     # Fit bounds
     m.fit_bounds([[bbox.min_y, bbox.min_x], [bbox.max_y, bbox.max_x]])
 
-    # Save map
-    m.save(map_file)
+    return m
 
 
 def statistics(
-    groups: list[list[types.Position]],
-    measure: Callable[[types.Position, types.Position], float],
+    groups: list[types.Point],
+    world_coords: bool,
     stats_file: str,
+    memory_budget: float = common.PAIRWISE_MEMORY,
+    samples: int = 0,
+    workers: int = 1,
 ):
     """
     Outlines some route statistics. Statistics are written to file, if provided.
+    Distances between all pairs of points are calculated block-wise within the given
+    memory budget (in MB) using the given number of worker processes. If samples is
+    given, the average distance is estimated from that many sampled pairs instead (with
+    min and max being exact, see common.sampled_distance_stats and common.diameter).
     """
     # Collect statistics
-    all_points = [item for sublist in groups for item in sublist.points]
-    max, min, agg, avg = 0.0, sys.float_info.max, 0.0, 0.0
-    dist_count = 0
-    for i1, p1 in enumerate(all_points):
-        for i2, p2 in enumerate(all_points):
-            if i2 < i1:
-                continue
-            dist_count += 1
-            dist = measure(p1, p2)
-            agg += dist
-            if max < dist:
-                max = dist
-            if min > dist:
-                min = dist
-    if min == sys.float_info.max:
-        min = 0.0
-    if dist_count > 0:
-        avg = agg / dist_count
-
-    stats = [
-        types.Stat("npoints", "Total points", len(all_points)),
-        types.Stat("distance_min", "Distance (min)", min),
-        types.Stat("distance_max", "Distance (max)", max),
-        types.Stat("distance_avg", "Distance (avg)", avg),
-    ]
+    all_coords = np.concatenate([g.coords for g in groups]).reshape(-1, 2)
+    npoints = len(all_coords)
+    if samples > 0:
+        min, avg, avg_error = common.sampled_distance_stats(all_coords, world_coords, samples)
+        max = common.diameter(all_coords, world_coords)
+        stats = [
+            types.Stat("npoints", "Total points", npoints),
+            types.Stat("distance_min", "Distance (min)", min),
+            types.Stat("distance_max", "Distance (max)", max),
+            types.Stat("distance_avg", "Distance (avg, estimate)", avg),
+            types.Stat("distance_avg_error", "Distance (avg, 95% confidence +/-)", avg_error),
+        ]
+    else:
+        min, max, agg, dist_count = common.pairwise_distance_stats(all_coords, world_coords, memory_budget, workers)
+        avg = agg / dist_count if dist_count > 0 else 0.0
+        stats = [
+            types.Stat("npoints", "Total points", npoints),
+            types.Stat("distance_min", "Distance (min)", min),
+            types.Stat("distance_max", "Distance (max)", max),
+            types.Stat("distance_avg", "Distance (avg)", avg),
+        ]
 
     # Log statistics
     print("Point stats")
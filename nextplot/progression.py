@@ -6,10 +6,9 @@ import os
 import re
 import sys
 
-import jsonpath_ng
 import plotly.graph_objects as go
 
-from . import common
+from . import common, types
 
 # ==================== This file contains value progression plotting code (mode: 'progression')
 
@@ -193,6 +192,29 @@ def arguments(parser):
         default=1,
         help="weight / width factor to apply to the points and lines (e.g., 1.5)",
     )
+    parser.add_argument(
+        "--plot_renderer",
+        type=types.PlotRenderer,
+        choices=list(types.PlotRenderer),
+        default=types.PlotRenderer.svg.value,
+        help="renderer of the interactive plot (webgl handles many more points in the browser)",
+    )
+    parser.add_argument(
+        "--plotly_js",
+        type=str,
+        nargs="?",
+        default=common.PLOTLY_JS_INLINE,
+        help="how to include plotly.js in the interactive plot: inline (embedded in each file), "
+        + "directory (shared plotly.min.js next to the plot) or the path of a local asset directory "
+        + "(plotly.js is written there once and referenced by the plot)",
+    )
+    parser.add_argument(
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        default=False,
+        help="indicates whether to print additional diagnostic information",
+    )
     parser.add_argument(
         "--nextroute",
         dest="nextroute",
@@ -304,9 +326,9 @@ def parse(
 
         # Extract values
         points = []
-        expr_solution = jsonpath_ng.parse(jpath_solution)
-        expr_value = jsonpath_ng.parse(jpath_value)
-        expr_elapsed = jsonpath_ng.parse(jpath_elapsed)
+        expr_solution = common.parse_jpath(jpath_solution)
+        expr_value = common.parse_jpath(jpath_value)
+        expr_elapsed = common.parse_jpath(jpath_elapsed)
         for match_solution in expr_solution.find(json_data):
             value = expr_value.find(match_solution.value)
             elapsed = expr_elapsed.find(match_solution.value)
@@ -342,6 +364,7 @@ def create_figure(
     plotly_theme: str,
     legend_position: str,
     weight: float,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
 ) -> go.Figure:
     """
     Creates a plotly figure from the given progressions.
@@ -353,8 +376,10 @@ def create_figure(
     :param color_profile: Color profile to use.
     :param plotly_theme: Plotly theme to use.
     :param legend_position: Legend position (top, bottom, left, right).
+    :param plot_renderer: Renderer of the plot (svg or webgl).
     :return: Plotly figure.
     """
+    scatter = common.scatter_type(plot_renderer)
     # Prepare colors
     colors = None
     if color_profile != "default":
@@ -389,7 +414,7 @@ def create_figure(
         if colors is not None:
             color = f"rgb({colors[i].rgb[0]},{colors[i].rgb[1]},{colors[i].rgb[2]})"
             fig.add_trace(
-                go.Scatter(
+                scatter(
                     x=xs,
                     y=ys,
                     line={
@@ -406,7 +431,7 @@ def create_figure(
             )
         else:
             fig.add_trace(
-                go.Scatter(
+                scatter(
                     x=xs,
                     y=ys,
                     line={
@@ -443,11 +468,17 @@ def plot(
     legend_position: str,
     weight: float,
     nextroute: bool,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+    plotly_js: str = common.PLOTLY_JS_INLINE,
+    verbose: bool = False,
 ):
     """
     Plots value progression based on the given arguments.
     Interprets args, reads .json, plots a .png and plots an interactive .html.
     """
+    # Start the image renderer in the background (overlaps its startup with data preparation)
+    common.start_image_renderers()
+
     # Apply profiles, if requested
     profile = ProgressionPlotProfile(
         jpath_solution=jpath_solution,
@@ -502,6 +533,7 @@ def plot(
         plotly_theme,
         legend_position,
         weight,
+        plot_renderer,
     )
 
     # Write image
@@ -510,7 +542,7 @@ def plot(
         if output_png == "":
             output_png = "plot.png"
         print(f"Plotting image to {output_png}")
-    fig.write_image(output_png, scale=3)
+    common.write_image(fig, output_png, scale=3, verbose=verbose)
 
     # Write html
     if output_html is None:
@@ -518,4 +550,4 @@ def plot(
         if output_html == "":
             output_html = "plot.html"
         print(f"Plotting html to {output_html}")
-    fig.write_html(output_html)
+    common.write_html(fig, output_html, plotly_js)
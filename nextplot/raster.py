@@ -0,0 +1,463 @@
+import math
+
+import numpy as np
+import plotly.graph_objects as go
+
+# ==================== This file contains a NumPy rasterizer for static images of large datasets
+
+RASTER_MARGIN = 20  # margin around the drawn data (in pixels)
+RASTER_CHUNK = 1 << 21  # max. number of pixel samples processed at once (bounds the memory use)
+RASTER_BACKGROUND = "white"  # background color, if not given by the plotly template (as in plotly)
+FILL_OPACITY = 0.5  # opacity of a single fill (matches plotly's default for filled traces)
+OPAQUE = 1 - 1e-9  # max. alpha of a sample (keeps the transmittance of fully covered pixels finite)
+MARKER_SUBPIXELS = 8  # marker centers are snapped to 1 / MARKER_SUBPIXELS of a pixel (coincident ones drawn once)
+DENSE_KEYS = 8  # chunks with at most DENSE_KEYS groups per pixel and sample are merged group by group (else sorted)
+
+# Draw order of the primitives of the same trace (as plotly draws fill, line and markers of a trace)
+KIND_FILL, KIND_LINE, KIND_MARKER = 0, 1, 2
+
+
+def color_rgb(color: str) -> tuple[float, float, float]:
+    """
+    Converts the given color (#rrggbb, #rgb, rgb(r, g, b), rgba(r, g, b, a) or a color name) to RGB.
+    """
+    color = color.strip().lower()
+    if color.startswith("#"):
+        digits = color[1:] if len(color) > 4 else "".join(d * 2 for d in color[1:])
+        return tuple(float(int(digits[i : i + 2], 16)) for i in (0, 2, 4))
+    if color.startswith("rgb"):
+        values = color[color.index("(") + 1 : color.index(")")].split(",")
+        return tuple(float(v) for v in values[:3])
+    try:
+        from PIL import ImageColor
+    except ImportError as e:
+        raise Exception("the raster image backend requires Pillow (pip install pillow)") from e
+    return tuple(float(v) for v in ImageColor.getrgb(color)[:3])
+
+
+def colors_rgb(colors: list[str]) -> np.ndarray:
+    """
+    Converts the given colors to an (n, 3) RGB array (see color_rgb).
+    """
+    return np.array([color_rgb(c) for c in colors], dtype=np.float64).reshape(-1, 3)
+
+
+def template_colors(plotly_theme: str) -> tuple[str, str]:
+    """
+    Returns the paper and plot background colors of the given plotly template.
+    """
+    layout = go.Layout(template=plotly_theme).template.layout
+    return layout.paper_bgcolor or RASTER_BACKGROUND, layout.plot_bgcolor or RASTER_BACKGROUND
+
+
+def group_coords(groups: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenates the given coordinate groups and returns them alongside the group index of each coordinate.
+    """
+    groups = [np.asarray(g, dtype=np.float64).reshape(-1, 2) for g in groups]
+    sizes = np.array([len(g) for g in groups], dtype=np.int64)
+    coords = np.concatenate(groups + [np.empty((0, 2))])
+    return coords, np.repeat(np.arange(len(groups)), sizes)
+
+
+def expand(counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the element index and the local sample index of all samples of the given
+    per-element sample counts.
+    """
+    element = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(len(element)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return element, local
+
+
+def chunk_ranges(layers: list) -> list[list[tuple[object, int, int]]]:
+    """
+    Splits the elements of the given layers (see Spans, Segments and Discs) into chunks
+    of about RASTER_CHUNK samples in draw order (a chunk exceeds it by at most its last
+    element). Returns the element ranges (layer, start, end) of each chunk.
+    """
+    keys = np.concatenate([layer.keys for layer in layers] + [np.empty(0, dtype=np.int64)])
+    counts = np.concatenate([layer.counts for layer in layers] + [np.empty(0, dtype=np.int64)])
+    order = np.argsort(keys, kind="stable")
+    chunk = np.empty(len(keys), dtype=np.int64)
+    chunk[order] = (np.cumsum(counts[order]) - counts[order]) // RASTER_CHUNK
+    ids = np.unique(chunk)
+    ranges, offset = [[] for _ in ids], 0
+    for layer in layers:
+        # The elements of a layer are sorted by draw order, hence their chunks are ascending
+        bounds = np.searchsorted(chunk[offset : offset + len(layer.keys)], np.r_[ids, np.iinfo(np.int64).max])
+        for c, (start, end) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist(), strict=True)):
+            if end > start:
+                ranges[c].append((layer, start, end))
+        offset += len(layer.keys)
+    return ranges
+
+
+class Compositor:
+    """
+    Composites the pixel samples (flat pixel index, alpha, color index and draw order
+    key) of the given chunks onto the (pixels, 3) image in draw order, i.e., later
+    groups are drawn over earlier ones (like the traces of a plotly figure). Samples
+    of the same group and pixel count once (with their max. alpha), such that the
+    segments and markers of a group do not accumulate. colors holds the RGB values of
+    the color indices. Groups are merged in a per-pixel coverage buffer (which carries
+    a group over to the next chunk), the middle groups of chunks with many groups are
+    merged by sorting instead.
+    """
+
+    def __init__(self, image: np.ndarray, colors: np.ndarray):
+        self.image = image
+        self.colors = colors
+        self.coverage = np.zeros(len(image), dtype=np.float32)
+        self.key, self.color = None, None
+
+    def add(self, samples: tuple, keys: np.ndarray):
+        """
+        Composites the samples of the next chunk (draw order keys >= those of previous
+        chunks). keys holds the distinct keys of the chunk (ascending).
+        """
+        index, alpha, color, key = samples
+        if len(index) <= 0:
+            return
+        if len(keys) == 1:
+            self.merge(index, alpha, color, int(keys[0]))
+            return
+        if len(keys) * len(self.image) <= DENSE_KEYS * len(index) or len(keys) == 2:
+            for k in keys.tolist():
+                self.merge(*(a[key == k] for a in (index, alpha, color)), k)
+            return
+        first, last = int(keys[0]), int(keys[-1])
+        self.merge(*(a[key == first] for a in (index, alpha, color)), first)
+        middle = (key != first) & (key != last)
+        self.sort(*(a[middle] for a in (index, alpha, color, key)))
+        self.merge(*(a[key == last] for a in (index, alpha, color)), last)
+
+    def merge(self, index: np.ndarray, alpha: np.ndarray, color: np.ndarray, key: int):
+        """
+        Merges the given samples of one group into the coverage buffer.
+        """
+        if len(index) <= 0:
+            return
+        if key != self.key:
+            self.flush()
+            self.key, self.color = key, int(color[0])
+        np.maximum.at(self.coverage, index, alpha)
+
+    def flush(self):
+        """
+        Draws the group in the coverage buffer onto the image and clears the buffer.
+        """
+        if self.key is None:
+            return
+        pixels = np.flatnonzero(self.coverage)
+        a = self.coverage[pixels].astype(np.float64)[:, None]
+        self.image[pixels] = self.image[pixels] * (1 - a) + self.colors[self.color] * a
+        self.coverage[pixels] = 0
+        self.key, self.color = None, None
+
+    def sort(self, index: np.ndarray, alpha: np.ndarray, color: np.ndarray, key: np.ndarray):
+        """
+        Draws the given samples of several groups onto the image (after the group in
+        the coverage buffer).
+        """
+        self.flush()
+        # Sort by pixel and draw order, and merge the samples of the same group per pixel
+        sort = np.lexsort((key, index))
+        index, alpha, color, key = index[sort], alpha[sort].astype(np.float64), color[sort], key[sort]
+        starts = np.flatnonzero(np.r_[True, (index[1:] != index[:-1]) | (key[1:] != key[:-1])])
+        alpha = np.maximum.reduceat(alpha, starts)
+        index, color = index[starts], color[starts]
+        # Drawing sample i over the samples before it keeps transmittance(i) = prod_{j > i} (1 - alpha_j)
+        # of its color in the final pixel (suffix sums of the logarithms per pixel)
+        log = np.log1p(-np.minimum(alpha, OPAQUE))
+        suffix = np.cumsum(log[::-1])[::-1]
+        first = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        ends = np.r_[first[1:], len(index)]
+        after = np.append(suffix, 0.0)[np.repeat(ends, np.diff(np.r_[first, len(index)]))]
+        weight = alpha * np.exp(suffix - log - after)
+        background = np.exp(suffix[first] - after[first])
+        pixels = index[first]
+        result = self.image[pixels] * background[:, None]
+        for c in range(3):
+            result[:, c] += np.bincount(index, weight * self.colors[color, c], minlength=len(self.image))[pixels]
+        self.image[pixels] = result
+
+
+class Spans:
+    """
+    Horizontal pixel spans of filled polygons (scanline filling, even-odd rule, pixel
+    centers), sorted by draw order.
+    """
+
+    def __init__(self, canvas, polygons: list[np.ndarray], colors: np.ndarray, orders: np.ndarray, transform: tuple):
+        self.width = canvas.width
+        closed = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons]
+        starts, polygon = group_coords(closed)
+        ends, _ = group_coords([np.roll(p, -1, axis=0) for p in closed])
+        a, b = canvas.to_pixels(starts, transform), canvas.to_pixels(ends, transform)
+        # Rows whose centers are crossed by each edge (half-open, so every row is crossed an even number of times)
+        low, high = np.minimum(a[:, 1], b[:, 1]), np.maximum(a[:, 1], b[:, 1])
+        first = np.clip(np.ceil(low - 0.5), 0, canvas.height).astype(np.int64)
+        last = np.clip(np.ceil(high - 0.5), 0, canvas.height).astype(np.int64)
+        counts = np.maximum(last - first, 0)
+        edge, local = expand(counts)
+        row = first[edge] + local
+        t = (row + 0.5 - a[edge, 1]) / (b[edge, 1] - a[edge, 1])
+        x = a[edge, 0] + t * (b[edge, 0] - a[edge, 0])
+        # Pair up the sorted crossings of each polygon and row into spans
+        order = np.lexsort((x, row, polygon[edge], orders[polygon[edge]]))
+        row, x, owner = row[order][0::2], x[order], polygon[edge][order][0::2]
+        self.row = row
+        self.start = np.clip(np.ceil(x[0::2] - 0.5), 0, canvas.width).astype(np.int64)
+        end = np.clip(np.ceil(x[1::2] - 0.5), 0, canvas.width).astype(np.int64)
+        self.counts = np.maximum(end - self.start, 0)
+        self.colors, self.keys = colors[owner], orders[owner]
+
+    def samples(self, start: int, end: int) -> tuple:
+        """
+        Returns the samples of the given range of spans (see Compositor).
+        """
+        span, local = expand(self.counts[start:end])
+        span += start
+        index = self.row[span] * self.width + self.start[span] + local
+        return index, np.full(len(index), FILL_OPACITY, dtype=np.float32), self.colors[span], self.keys[span]
+
+
+class Segments:
+    """
+    Segments of polylines of the given width (in pixels), sorted by draw order. The
+    pixels around each segment are enumerated along its major axis, and their coverage
+    is given by the distance to the segment.
+    """
+
+    def __init__(
+        self, canvas, lines: list[np.ndarray], colors: np.ndarray, orders: np.ndarray, width: float, transform: tuple
+    ):
+        self.canvas = canvas
+        lines = [np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines]
+        a, line = group_coords([line[:-1] for line in lines])
+        b, _ = group_coords([line[1:] for line in lines])
+        sort = np.argsort(orders[line], kind="stable")
+        a, b, line = canvas.to_pixels(a[sort], transform), canvas.to_pixels(b[sort], transform), line[sort]
+        # Work in (major, minor) axis coordinates of each segment
+        self.major = np.abs(b[:, 0] - a[:, 0]) >= np.abs(b[:, 1] - a[:, 1])
+        self.a = np.where(self.major[:, None], a, a[:, ::-1])
+        b = np.where(self.major[:, None], b, b[:, ::-1])
+        self.delta = b - self.a
+        slope = np.divide(self.delta[:, 1], self.delta[:, 0], out=np.zeros(len(a)), where=self.delta[:, 0] != 0)
+        self.half = width / 2
+        self.column_first = np.floor(np.minimum(self.a[:, 0], b[:, 0]) - self.half - 1).astype(np.int64)
+        column_last = np.floor(np.maximum(self.a[:, 0], b[:, 0]) + self.half + 1).astype(np.int64)
+        self.reach = np.ceil(self.half * np.sqrt(1 + slope**2) + 1.5).astype(np.int64)
+        self.rows = 2 * self.reach + 1
+        self.counts = (column_last - self.column_first + 1) * self.rows
+        self.length_squared = (self.delta**2).sum(axis=1)
+        self.colors, self.keys = colors[line], orders[line]
+
+    def samples(self, start: int, end: int) -> tuple:
+        """
+        Returns the samples of the given range of segments (see Compositor).
+        """
+        segment, local = expand(self.counts[start:end])
+        segment += start
+        a, delta = self.a[segment], self.delta[segment]
+        u = self.column_first[segment] + local // self.rows[segment]
+        # Minor axis center of the segment at the column (clamped to its end points)
+        t = np.divide(u + 0.5 - a[:, 0], delta[:, 0], out=np.zeros(len(u)), where=delta[:, 0] != 0)
+        center = a[:, 1] + np.clip(t, 0, 1) * delta[:, 1]
+        v = np.floor(center).astype(np.int64) - self.reach[segment] + local % self.rows[segment]
+        # Distance of the pixel center to the segment
+        pu, pv = u + 0.5 - a[:, 0], v + 0.5 - a[:, 1]
+        length_squared = self.length_squared[segment]
+        t = np.divide(
+            pu * delta[:, 0] + pv * delta[:, 1], length_squared, out=np.zeros(len(u)), where=length_squared > 0
+        )
+        t = np.clip(t, 0, 1)
+        distance = np.hypot(pu - t * delta[:, 0], pv - t * delta[:, 1])
+        coverage = np.clip(self.half + 0.5 - distance, 0, 1)
+        keep = coverage > 0
+        segment, u, v, coverage = segment[keep], u[keep], v[keep], coverage[keep]
+        x = np.where(self.major[segment], u, v)
+        y = np.where(self.major[segment], v, u)
+        return self.canvas.samples(x, y, coverage, self.colors[segment], self.keys[segment])
+
+
+class Discs:
+    """
+    Markers of the given diameter (in pixels) as discs, sorted by draw order. The
+    coverage of each pixel of the footprint of a disc is given by the distance of the
+    pixel center to the disc center. Density-aware: disc centers are snapped to
+    1 / MARKER_SUBPIXELS of a pixel, such that the footprints are precomputed per
+    subpixel position and coincident discs of the same group are drawn once (they
+    cover the same pixels). Dense data costs one disc per occupied subpixel cell
+    rather than one per point.
+    """
+
+    def __init__(
+        self, canvas, points: list[np.ndarray], colors: np.ndarray, orders: np.ndarray, size: float, transform: tuple
+    ):
+        self.canvas = canvas
+        coords, group = group_coords(points)
+        cells = np.floor(canvas.to_pixels(coords, transform) * MARKER_SUBPIXELS).astype(np.int64)
+        sort = np.lexsort((cells[:, 1], cells[:, 0], group, orders[group]))
+        cells, group = cells[sort], group[sort]
+        distinct = np.ones(len(group), dtype=bool)
+        distinct[1:] = np.any(cells[1:] != cells[:-1], axis=1) | (group[1:] != group[:-1])
+        cells, group = cells[distinct], group[distinct]
+        self.pixels, phase = np.divmod(cells, MARKER_SUBPIXELS)
+        self.phase = phase[:, 1] * MARKER_SUBPIXELS + phase[:, 0]
+        # Coverage of the footprint pixels (relative to the pixel of the center) per subpixel position of the center
+        radius = size / 2
+        reach = math.ceil(radius + 0.5)
+        offsets = np.arange(-reach, reach + 1)
+        dx, dy = (o.ravel() for o in np.meshgrid(offsets, offsets))
+        centers = (np.arange(MARKER_SUBPIXELS) + 0.5) / MARKER_SUBPIXELS
+        cx, cy = (o.ravel()[:, None] for o in np.meshgrid(centers, centers))
+        stamps = np.clip(radius + 0.5 - np.hypot(dx + 0.5 - cx, dy + 0.5 - cy), 0, 1).astype(np.float32)
+        footprint = np.any(stamps > 0, axis=0)
+        self.dx, self.dy, self.stamps = dx[footprint], dy[footprint], stamps[:, footprint]
+        self.counts = np.full(len(group), len(self.dx), dtype=np.int64)
+        self.colors, self.keys = colors[group], orders[group]
+
+    def samples(self, start: int, end: int) -> tuple:
+        """
+        Returns the samples of the given range of discs (see Compositor).
+        """
+        x = self.pixels[start:end, 0:1] + self.dx
+        y = self.pixels[start:end, 1:2] + self.dy
+        coverage = self.stamps[self.phase[start:end]]
+        colors = np.repeat(self.colors[start:end], len(self.dx))
+        keys = np.repeat(self.keys[start:end], len(self.dx))
+        return self.canvas.samples(x.ravel(), y.ravel(), coverage.ravel(), colors, keys)
+
+
+class Canvas:
+    """
+    Rasterizes fills, lines and markers into an image of the given size. Primitives
+    are collected first and drawn once the extent of all of them is known. Every
+    group of primitives has a draw order (like the trace index in a plotly figure),
+    groups drawn later cover earlier ones. The image is filled with the paper color
+    and the plot area (within the margin) with the background color. Edges are
+    anti-aliased by pixel coverage. The pixel samples of all primitives are
+    generated and composited onto the image in chunks of RASTER_CHUNK samples (in
+    draw order), so memory is bounded by the image and chunk size, and rendering
+    time grows linearly with the pixels covered by the primitives.
+    """
+
+    def __init__(
+        self, width: float, height: float, paper: str = RASTER_BACKGROUND, background: str = RASTER_BACKGROUND
+    ):
+        self.width = max(int(round(width)), 1)
+        self.height = max(int(round(height)), 1)
+        self.paper = paper
+        self.background = background
+        self.fills = []
+        self.lines = []
+        self.markers = []
+        self.next_order = 0
+
+    def orders(self, count: int, order: list[int], kind: int) -> np.ndarray:
+        """
+        Returns the draw order keys of the given number of groups. If no order is given,
+        the groups are drawn after all groups added so far (one after another).
+        """
+        if order is None:
+            order = np.arange(self.next_order, self.next_order + count)
+        order = np.asarray(order, dtype=np.int64).reshape(-1)
+        if len(order) > 0:
+            self.next_order = max(self.next_order, int(order.max()) + 1)
+        return order * 3 + kind
+
+    def add_fills(self, polygons: list[np.ndarray], colors: list[str], order: list[int] = None):
+        """
+        Adds filled polygons (one color per polygon) in the given draw order (see orders).
+        """
+        self.fills.append((polygons, colors, self.orders(len(polygons), order, KIND_FILL)))
+
+    def add_lines(self, lines: list[np.ndarray], colors: list[str], width: float, order: list[int] = None):
+        """
+        Adds polylines (one color per line) of the given width (in pixels) in the given draw order (see orders).
+        """
+        self.lines.append((lines, colors, self.orders(len(lines), order, KIND_LINE), width))
+
+    def add_markers(self, points: list[np.ndarray], colors: list[str], size: float, order: list[int] = None):
+        """
+        Adds circular markers (one color per point group) of the given diameter (in pixels)
+        in the given draw order (see orders).
+        """
+        self.markers.append((points, colors, self.orders(len(points), order, KIND_MARKER), size))
+
+    def transform(self) -> tuple[float, float, float]:
+        """
+        Determines the scale and center of the mapping from data to pixel coordinates,
+        such that all primitives fit into the image (keeping the aspect ratio of the data).
+        """
+        groups = [g for groups, *_ in self.fills + self.lines + self.markers for g in groups]
+        coords, _ = group_coords(groups)
+        if len(coords) <= 0:
+            return 1.0, 0.0, 0.0
+        low, high = coords.min(axis=0), coords.max(axis=0)
+        sizes = [w for *_, w in self.lines + self.markers]
+        padding = RASTER_MARGIN + max(sizes + [0]) / 2
+        extent = high - low
+        space = np.maximum(np.array([self.width, self.height]) - 2 * padding, 1.0)
+        scales = [s / e for s, e in zip(space.tolist(), extent.tolist(), strict=True) if e > 0]
+        center = (low + high) / 2
+        return min(scales) if scales else 1.0, float(center[0]), float(center[1])
+
+    def to_pixels(self, coords: np.ndarray, transform: tuple[float, float, float]) -> np.ndarray:
+        """
+        Maps the given data coordinates to (continuous) pixel coordinates.
+        """
+        scale, cx, cy = transform
+        pixels = np.empty_like(coords)
+        pixels[:, 0] = (coords[:, 0] - cx) * scale + self.width / 2
+        pixels[:, 1] = self.height / 2 - (coords[:, 1] - cy) * scale
+        return pixels
+
+    def samples(self, x: np.ndarray, y: np.ndarray, coverage: np.ndarray, colors: np.ndarray, keys: np.ndarray):
+        """
+        Drops samples outside of the image, and returns the others as flat pixel index,
+        coverage, color index and draw order key (see Compositor).
+        """
+        if len(x) > 0 and (x.min() < 0 or x.max() >= self.width or y.min() < 0 or y.max() >= self.height):
+            keep = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+            x, y, coverage, colors, keys = x[keep], y[keep], coverage[keep], colors[keep], keys[keep]
+        return y * self.width + x, coverage.astype(np.float32, copy=False), colors, keys
+
+    def render(self) -> np.ndarray:
+        """
+        Renders the image as (height, width, 3) RGB array.
+        """
+        transform = self.transform()
+        image = np.empty((self.height, self.width, 3))
+        image[:] = color_rgb(self.paper)
+        margin = min(RASTER_MARGIN, self.width // 2, self.height // 2)
+        image[margin : self.height - margin, margin : self.width - margin] = color_rgb(self.background)
+        image = image.reshape(-1, 3)
+        # Prepare the primitives (with colors as indices into one palette)
+        layers, palette = [], []
+        for primitives, kind in [(self.fills, Spans), (self.lines, Segments), (self.markers, Discs)]:
+            for groups, colors, orders, *size in primitives:
+                offset = sum(len(p) for p in palette)
+                palette.append(colors_rgb(colors))
+                layers.append(kind(self, groups, offset + np.arange(len(colors)), orders, *size, transform))
+        # Draw them chunk by chunk
+        compositor = Compositor(image, np.concatenate(palette + [np.empty((0, 3))]))
+        for ranges in chunk_ranges(layers):
+            samples = [layer.samples(start, end) for layer, start, end in ranges]
+            samples = samples[0] if len(samples) == 1 else tuple(np.concatenate(s) for s in zip(*samples, strict=True))
+            keys = np.unique(np.concatenate([layer.keys[start:end] for layer, start, end in ranges]))
+            compositor.add(samples, keys)
+        compositor.flush()
+        return np.clip(np.round(image), 0, 255).astype(np.uint8).reshape(self.height, self.width, 3)
+
+    def save(self, file: str):
+        """
+        Renders the image and writes it to the given file (format determined by the extension).
+        """
+        try:
+            from PIL import Image
+        except ImportError as e:
+            raise Exception("the raster image backend requires Pillow (pip install pillow)") from e
+        Image.fromarray(self.render()).save(file)
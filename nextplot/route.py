@@ -1,10 +1,11 @@
 import json
 
 import folium
+import numpy as np
 import plotly.graph_objects as go
 from folium import plugins
 
-from . import common, osrm, routingkit, types
+from . import accumulators, common, jsonstream, osrm, parallel, raster, routingkit, types
 
 # ==================== This file contains route plotting code (mode: 'route')
 
@@ -212,6 +213,14 @@ def arguments(parser):
         action="store_true",
         help="provide routingkit distance information instead of time",
     )
+    parser.add_argument(
+        "--simplify",
+        dest="simplify",
+        action="store_true",
+        default=False,
+        help="indicates whether to simplify the road geometry of OSRM/routingkit routes"
+        + " (drops vertices that are not visible at the resolution of the plot image)",
+    )
 
 
 # ==================== Route plotting specific functionality
@@ -227,14 +236,26 @@ def parse(
     jpath_pos: str,
     jpath_x: str,
     jpath_y: str,
-) -> tuple[list[list[types.Position]], list[list[types.Position]]]:
+    keep_desc: bool = True,
+    stream: bool = False,
+    float32: bool = False,
+) -> tuple[types.PositionArray, types.PositionArray]:
     """
     Parses the route data from the file(s).
     """
     # Load json data
-    content_route, content_pos = common.load_data(input_route, input_pos)
+    if stream:
+        content_route, content_pos = jsonstream.load_data(
+            input_route,
+            [jpath_route, jpath_unassigned],
+            input_pos,
+            [jpath_pos],
+        )
+    else:
+        content_route, content_pos = common.load_data(input_route, input_pos)
 
     # Extract routes
+    dtype = np.float32 if float32 else np.float64
     points = common.extract_position_groups(
         content_route,
         jpath_route,
@@ -242,10 +263,12 @@ def parse(
         jpath_pos,
         jpath_x,
         jpath_y,
+        keep_desc,
+        dtype,
     )
 
     # Extract unassigned (if given)
-    unassigned = []
+    unassigned = types.PositionArray.empty(dtype)
     if jpath_unassigned:
         unassigned = common.extract_position_groups(
             content_route,
@@ -254,6 +277,8 @@ def parse(
             jpath_pos,
             jpath_unassigned_x if jpath_unassigned_x else jpath_x,
             jpath_unassigned_y if jpath_unassigned_y else jpath_y,
+            keep_desc,
+            dtype,
         )
 
     return points, unassigned
@@ -261,7 +286,7 @@ def parse(
 
 def create_plot(
     routes: list[types.Route],
-    unassigned: list[types.Position],
+    unassigned: types.PositionArray,
     label_x: str,
     label_y: str,
     plotly_theme: str,
@@ -270,10 +295,14 @@ def create_plot(
     no_points: bool,
     weight_points: float,
     weight_route: float,
+    consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
 ) -> go.Figure:
     """
-    Plots the given routes on a plotly figure.
+    Plots the given routes on a plotly figure. If consolidated, all routes are
+    packed into few traces (see common.line_traces and common.marker_trace).
     """
+    scatter = common.scatter_type(plot_renderer)
     # Init plot
     fig = go.Figure(
         layout=go.Layout(
@@ -287,38 +316,43 @@ def create_plot(
     )
 
     # Plot the routes
-    for i, route in enumerate(routes):
-        if len(route.points) <= 0:
-            continue
-        route_line = route.to_polyline(omit_start, omit_end)
-        xs, ys = [p.lon for p in route_line], [p.lat for p in route_line]
-        fig.add_trace(
-            go.Scatter(
-                x=xs,
-                y=ys,
-                mode="lines",
-                line={"color": route.color.hex, "width": weight_route * 3},
-                name=f"Route {i+1}",
-            )
-        )
+    plotted = [(i, r) for i, r in enumerate(routes) if len(r.coords) > 0]
+    if consolidated:
+        ids, colors = [i + 1 for i, _ in plotted], [r.color.hex for _, r in plotted]
+        lines = [r.to_polyline_coords(omit_start, omit_end) for _, r in plotted]
+        fig.add_traces(common.line_traces(lines, colors, ids, "Route", weight_route * 3, plot_renderer=plot_renderer))
         if not no_points:
-            route_points = route.to_points(omit_start, omit_end)
+            points = [r.to_coords(omit_start, omit_end) for _, r in plotted]
+            fig.add_trace(common.marker_trace(points, colors, ids, "Route", 5 * weight_points, plot_renderer))
+    else:
+        for i, route in plotted:
+            route_line = route.to_polyline_coords(omit_start, omit_end)
             fig.add_trace(
-                go.Scatter(
-                    x=[p.lon for p in route_points],
-                    y=[p.lat for p in route_points],
-                    mode="markers",
-                    marker={"color": route.color.hex, "size": 5 * weight_points},
+                scatter(
+                    x=route_line[:, 0],
+                    y=route_line[:, 1],
+                    mode="lines",
+                    line={"color": route.color.hex, "width": weight_route * 3},
                     name=f"Route {i+1}",
                 )
             )
+            if not no_points:
+                route_points = route.to_coords(omit_start, omit_end)
+                fig.add_trace(
+                    scatter(
+                        x=route_points[:, 0],
+                        y=route_points[:, 1],
+                        mode="markers",
+                        marker={"color": route.color.hex, "size": 5 * weight_points},
+                        name=f"Route {i+1}",
+                    )
+                )
 
     # Plot the unassigned points
-    unassigned_points = [p for g in unassigned for p in g]
     fig.add_trace(
-        go.Scatter(
-            x=[p.lon for p in unassigned_points],
-            y=[p.lat for p in unassigned_points],
+        scatter(
+            x=unassigned.coords[:, 0],
+            y=unassigned.coords[:, 1],
             mode="markers",
             marker={"color": COLOR_UNASSIGNED, "size": 5 * weight_points},
             name="Unassigned",
@@ -329,9 +363,37 @@ def create_plot(
     return fig
 
 
+def create_raster(
+    routes: list[types.Route],
+    unassigned: types.PositionArray,
+    omit_start: bool,
+    omit_end: bool,
+    no_points: bool,
+    weight_points: float,
+    weight_route: float,
+    width: float,
+    height: float,
+    plotly_theme: str,
+) -> raster.Canvas:
+    """
+    Draws the given routes on a raster canvas in the trace order of create_plot.
+    """
+    canvas = raster.Canvas(width, height, *raster.template_colors(plotly_theme))
+    plotted = [r for r in routes if len(r.coords) > 0]
+    colors = [r.color.hex for r in plotted]
+    # Every route is drawn as line trace followed by its marker trace
+    traces = 1 if no_points else 2
+    order = np.arange(len(plotted)) * traces
+    canvas.add_lines([r.to_polyline_coords(omit_start, omit_end) for r in plotted], colors, weight_route * 3, order)
+    if not no_points:
+        canvas.add_markers([r.to_coords(omit_start, omit_end) for r in plotted], colors, 5 * weight_points, order + 1)
+    canvas.add_markers([unassigned.coords], [COLOR_UNASSIGNED], 5 * weight_points)
+    return canvas
+
+
 def create_map(
     routes: list[types.Route],
-    unassigned: list[types.Position],
+    unassigned: types.PositionArray,
     no_points: bool,
     weight_points: float,
     weight_route: float,
@@ -346,7 +408,7 @@ def create_map(
     Plots the given routes on a folium map.
     """
     # Determine bbox
-    bbox = common.bounding_box([r.points for r in routes] + unassigned)
+    bbox = common.bounding_box(routes + [unassigned])
 
     # Make map plot of routes
     m, base_tree = common.create_map(
@@ -360,7 +422,7 @@ def create_map(
 
     # Plot the routes themselves
     for i, route in enumerate(routes):
-        if len(route.points) <= 0:
+        if len(route.coords) <= 0:
             continue
         layer_name = f"Route {i+1}"
         route_groups[route] = folium.FeatureGroup(layer_name)
@@ -381,7 +443,6 @@ def create_map(
     if not no_points:
         for route in routes:
             for p, point in enumerate(route.to_points(omit_start, omit_end)):
-                d = point.desc.replace("\n", "<br/>").replace(r"`", r"\`")
                 text = (
                     "<p>"
                     + f"Stop: {p+1} / {len(route.points)}</br>"
@@ -390,7 +451,7 @@ def create_map(
                     + f"Location (lon/lat): {point[0]}, {point[1]}"
                     + "".join(["&nbsp;" for _ in range(0, 80)])
                     + "</p>"
-                    + f"JSON:</br><pre><code>{d}</code></pre></br>"
+                    + common.desc_html(point)
                 )
                 plot_map_point(
                     route_groups[route],
@@ -404,14 +465,13 @@ def create_map(
             points = route.to_points(omit_start, omit_end)
             if len(points) > 0:
                 start = points[0]
-                d = start.desc.replace("\n", "<br/>").replace(r"`", r"\`")
                 text = (
                     "<p>"
                     + f"First stop in route {i+1}</br>"
                     + f"Location (lon/lat): {start[0]}, {start[1]}"
                     + "".join(["&nbsp;" for _ in range(0, 80)])
                     + "</p>"
-                    + f"JSON:</br><pre><code>{d}</code></pre></br>"
+                    + common.desc_html(start)
                 )
                 plot_map_marker(
                     route_groups[route],
@@ -422,14 +482,13 @@ def create_map(
                 )
             if len(points) > 1:
                 end = points[-1]
-                d = end.desc.replace("\n", "<br/>").replace(r"`", r"\`")
                 text = (
                     "<p>"
                     + f"Last stop in route {i+1}</br>"
                     + f"Location (lon/lat): {end[0]}, {end[1]}"
                     + "".join(["&nbsp;" for _ in range(0, 80)])
                     + "</p>"
-                    + f"JSON:</br><pre><code>{d}</code></pre></br>"
+                    + common.desc_html(end)
                 )
                 plot_map_marker(
                     route_groups[route],
@@ -438,16 +497,16 @@ def create_map(
                     "glyphicon glyphicon-chevron-down",
                     "black",
                 )
-    for group in unassigned:
+    for g in range(len(unassigned)):
+        group = unassigned.positions(g)
         for p, point in enumerate(group):
-            d = point.desc.replace("\n", "<br/>").replace(r"`", r"\`")
             text = (
                 "<p>"
                 + f"Unassigned point: {p+1} / {len(group)}</br>"
                 + f"Location (lon/lat): {point[0]}, {point[1]}"
                 + "".join(["&nbsp;" for _ in range(0, 80)])
                 + "</p>"
-                + f"JSON:</br><pre><code>{d}</code></pre></br>"
+                + common.desc_html(point)
             )
             plot_map_point(unassigned_group, point, text, weight_points, COLOR_UNASSIGNED)
 
@@ -527,13 +586,30 @@ def plot(
     custom_map_tile: list[str],
     plotly_theme: str,
     nextroute: bool,
+    no_desc: bool = False,
+    stream: bool = False,
+    verbose: bool = False,
+    float32: bool = False,
+    workers: int = 1,
+    plot_consolidated: bool = False,
+    plot_renderer: types.PlotRenderer = types.PlotRenderer.svg,
+    plotly_js: str = common.PLOTLY_JS_INLINE,
+    image_backend: types.ImageBackend = types.ImageBackend.kaleido,
+    simplify: bool = False,
+    outputs: list[str] = common.OUTPUTS,
 ):
     """
     Plots routes based on the given arguments.
     Interprets args, reads .json, collects some stats,
     plots a .png and plots an interactive .html map.
+    Only the given outputs are produced, skipping all stages they do not need.
     """
 
+    # Determine the stages needed for the requested outputs
+    stages = common.required_stages(outputs, image_backend)
+    if common.STAGE_PARSE not in stages:
+        return
+
     # Determine base filename
     base_name = "plot"  # Default for STDIN
     if input_route:
@@ -563,7 +639,13 @@ def plot(
         profile.jpath_pos,
         profile.jpath_x,
         profile.jpath_y,
+        not no_desc,
+        stream,
+        float32,
     )
+    if verbose:
+        common.print_jpath_cache_info()
+        common.print_document_info()
 
     # Quit on no points
     if len(points) <= 0:
@@ -582,109 +664,155 @@ def plot(
             return
 
     # Wrap in routes
-    routes = [types.Route(r) for r in points]  # Wrap it
+    routes = points.wrap(types.Route)  # Wrap it
     if len(routes) <= 0:
         print(f"no routes could be extracted at the given path: {jpath_route}")
         return
 
     # Process routes
+    consecutive_distances = common.haversine_consecutive if world_coords else common.euclidean_consecutive
     for route in routes:
-        # Collect some statistics of the route
-        length = 0
-        for i in range(1, len(route.points)):
-            if world_coords:
-                length += common.haversine(
-                    route.points[i],
-                    route.points[i - 1],
-                )
-            else:
-                length += common.euclidean(
-                    route.points[i],
-                    route.points[i - 1],
-                )
-            route.points[i].distance = length
-        route.length = length
+        # Collect some statistics of the route (cumulative distance per stop)
+        coords = route.coords
+        route.set_distances(np.concatenate([np.zeros(min(len(coords), 1)), np.cumsum(consecutive_distances(coords))]))
 
     # Determine route shapes (if osrm or routingkit are available)
-    if osrm_host:
-        osrm.query_routes(osrm_host, routes)
-    elif rk_osm:
-        routingkit.query_routes(rk_bin, rk_osm, routes, rk_profile, rk_distance)
+    if common.STAGE_ENRICH in stages:
+        if osrm_host:
+            osrm.query_routes(osrm_host, routes)
+        elif rk_osm:
+            routingkit.query_routes(rk_bin, rk_osm, routes, rk_profile, rk_distance)
 
     # Dump some stats
-    statistics(routes, unassigned, stats_file, world_coords)
+    if common.STAGE_STATS in stages:
+        statistics(routes, unassigned, stats_file, world_coords, workers)
 
     # Determine bbox
-    bbox = common.bounding_box([r.points for r in routes])
+    bbox = common.bounding_box([points])
+
+    # Simplify road geometry (the tolerance is given in pixels of the image, whose longer side spans the bbox)
+    if simplify and not osrm_host and not rk_osm:
+        print("Warning: --simplify only applies to road geometry (--osrm_host or --rk_osm), ignoring it")
+    elif simplify and common.STAGE_SIMPLIFY in stages:
+        tolerance = common.SIMPLIFY_TOLERANCE * max(bbox.width, bbox.height) / common.IMAGE_SIZE
+        before, after = simplify_legs(routes, tolerance)
+        if before > 0:
+            print(f"Simplified route geometry from {before} to {after} vertices")
 
     # Make simple plot of routes
     aspect_ratio = (bbox.height) / (bbox.width) if bbox.width > 0 else 1
 
+    # Determine image size
+    image_width = min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio)
+    image_height = min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio)
+
     # Remove short routes
     if omit_short > 0:
-        routes = [r for r in routes if len(r.points) > omit_short]
+        routes = [r for r in routes if len(r.coords) > omit_short]
 
     # Prepares colors for the groups
-    common.prepare_colors(routes, colors, sort_color)
-
-    # Create figure
-    fig = create_plot(
-        routes,
-        unassigned,
-        "lon" if world_coords else "x",
-        "lat" if world_coords else "y",
-        plotly_theme,
-        omit_start,
-        omit_end,
-        no_points,
-        weight_points,
-        weight_route,
-    )
-
-    # Save interactive plot
+    if common.STAGE_COLORS in stages:
+        common.prepare_colors(routes, colors, sort_color)
+
+    # Determine output files
     plot_file = output_plot
-    if not plot_file:
+    if not plot_file and common.OUTPUT_PLOT in outputs:
         plot_file = base_name + ".plot.html"
         print(f"Plotting interactive plot to {plot_file}")
-    fig.write_html(plot_file)
-
-    # Save plot image
     image_file = output_image
-    if not image_file:
+    if not image_file and common.OUTPUT_IMAGE in outputs:
         image_file = base_name + ".plot.png"
         print(f"Plotting image to {image_file}")
-    fig.write_image(
-        image_file,
-        width=min(common.IMAGE_SIZE, common.IMAGE_SIZE / aspect_ratio),
-        height=min(common.IMAGE_SIZE, common.IMAGE_SIZE * aspect_ratio),
-    )
-
-    # Skip plotting on map, if no geo-coordinates
-    if not world_coords:
-        print("No world coordinates, skipping map plotting")
-        quit()
-
-    # Create map
-    m = create_map(
-        routes,
-        unassigned,
-        no_points,
-        weight_points,
-        weight_route,
-        omit_start,
-        omit_end,
-        route_direction,
-        route_animation_color,
-        start_end_markers,
-        custom_map_tile,
-    )
-
-    # Save map
     map_file = output_map
-    if not map_file:
+    if common.OUTPUT_MAP in outputs and not world_coords:
+        # Skip plotting on map, if no geo-coordinates
+        print("No world coordinates, skipping map plotting")
+    elif common.OUTPUT_MAP in outputs and not map_file:
         map_file = base_name + ".map.html"
         print(f"Plotting map to {map_file}")
-    m.save(map_file)
+
+    # Write outputs concurrently (the map and raster image only need the finished routes, start them right away)
+    # The kaleido renderer is only started if an image is requested (its startup overlaps with creating the figure)
+    kaleido_image = common.OUTPUT_IMAGE in outputs and image_backend == types.ImageBackend.kaleido
+    with common.OutputWriter(verbose, renderer=kaleido_image) as writer:
+        if common.STAGE_MAP in stages and world_coords:
+            writer.submit(
+                "map",
+                map_file,
+                lambda file: create_map(
+                    routes,
+                    unassigned,
+                    no_points,
+                    weight_points,
+                    weight_route,
+                    omit_start,
+                    omit_end,
+                    route_direction,
+                    route_animation_color,
+                    start_end_markers,
+                    custom_map_tile,
+                ).save(file),
+            )
+        if common.STAGE_RASTER in stages:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: create_raster(
+                    routes,
+                    unassigned,
+                    omit_start,
+                    omit_end,
+                    no_points,
+                    weight_points,
+                    weight_route,
+                    image_width,
+                    image_height,
+                    plotly_theme,
+                ).save(file),
+            )
+
+        # Create figure
+        if common.STAGE_FIGURE in stages:
+            fig = create_plot(
+                routes,
+                unassigned,
+                "lon" if world_coords else "x",
+                "lat" if world_coords else "y",
+                plotly_theme,
+                omit_start,
+                omit_end,
+                no_points,
+                weight_points,
+                weight_route,
+                plot_consolidated,
+                plot_renderer,
+            )
+
+        # Save interactive plot and image
+        if common.OUTPUT_PLOT in outputs:
+            writer.submit("plot", plot_file, lambda file: common.write_html(fig, file, plotly_js))
+        if kaleido_image:
+            writer.submit(
+                "image",
+                image_file,
+                lambda file: common.write_image(fig, file, width=image_width, height=image_height),
+            )
+
+
+def simplify_legs(routes: list[types.Route], tolerance: float) -> tuple[int, int]:
+    """
+    Simplifies the road geometry of the route legs (see common.simplify_lines),
+    keeping their start and end. Returns the number of vertices before and after.
+    """
+    legs = [leg for route in routes if route.legs is not None for leg in route.legs]
+    if len(legs) <= 0:
+        return 0, 0
+    kept = iter(common.simplify_lines([common.position_coords(leg) for leg in legs], tolerance))
+    for route in routes:
+        if route.legs is not None:
+            route.legs = [[leg[i] for i in next(kept).tolist()] for leg in route.legs]
+    after = sum(len(leg) for route in routes if route.legs is not None for leg in route.legs)
+    return sum(len(leg) for leg in legs), after
 
 
 def nextroute_profile() -> RoutePlotProfile:
@@ -804,44 +932,54 @@ def plot_map_route(
         raise Exception(f"unknown direction indicator {direction}")
 
 
+def route_metrics(coords: np.ndarray, length: float, metrics: accumulators.Summaries, world_coords: bool):
+    """
+    Feeds stops, length and diameter of the route with the given (n, 2) coordinates into the given metrics.
+    """
+    metrics.add(stops=len(coords), length=length, diameter=common.diameter(coords, world_coords))
+
+
 def statistics(
     routes: list[types.Route],
-    unassigned: list[list[types.Point]],
+    unassigned: types.PositionArray,
     stats_file: str,
     world_coords: bool,
+    workers: int = 1,
 ):
     """
     Outlines some route statistics. Statistics are written to file, if provided.
+    Route diameters are calculated using the given number of worker processes.
     """
     # Collect statistics
-    stops = [len(r.points) for r in routes]
-    lengths = [r.length for r in routes]
-    diameters = []
-    for r in routes:
-        max_diameter = 0
-        for p1 in r.points:
-            for p2 in r.points:
-                if world_coords:
-                    distance = common.haversine(p1, p2)
-                else:
-                    distance = common.euclidean(p1, p2)
-                if distance > max_diameter:
-                    max_diameter = distance
-        diameters.append(max_diameter)
+    _, metrics = parallel.reduce_groups(
+        route_metrics,
+        [r.coords for r in routes],
+        workers,
+        accumulators.Summaries("stops", "length", "diameter"),
+        world_coords,
+        group_args=[(r.length,) for r in routes],
+    )
+    stops, lengths, diameters = metrics["stops"], metrics["length"], metrics["diameter"]
     stats = [
         types.Stat("nroutes", "Route count", len(routes)),
-        types.Stat("nstops_max", "Route stops (max)", max(stops)),
-        types.Stat("nstops_min", "Route stops (min)", min(stops)),
-        types.Stat("nstops_avg", "Route stops (avg)", sum(stops) / float(len(routes))),
-        types.Stat("nstops_total", "Route stops (total)", sum(stops)),
-        types.Stat("length_max", "Route length (max)", max(lengths)),
-        types.Stat("length_min", "Route length (min)", min(lengths)),
-        types.Stat("length_avg", "Route length (avg)", sum(lengths) / float(len(routes))),
-        types.Stat("length_total", "Route length (total)", sum(lengths)),
-        types.Stat("diameter_max", "Route diameter (max)", max(diameters)),
-        types.Stat("diameter_min", "Route diameter (min)", min(diameters)),
-        types.Stat("diameter_avg", "Route diameter (avg)", sum(diameters) / float(len(routes))),
-        types.Stat("nunassigned", "Unassigned stops", sum([len(g) for g in unassigned])),
+        types.Stat("nstops_max", "Route stops (max)", int(stops.max)),
+        types.Stat("nstops_min", "Route stops (min)", int(stops.min)),
+        types.Stat("nstops_avg", "Route stops (avg)", stops.avg),
+        types.Stat("nstops_total", "Route stops (total)", int(stops.total)),
+        types.Stat("nstops_p50", "Route stops (p50)", stops.percentile(50)),
+        types.Stat("nstops_p90", "Route stops (p90)", stops.percentile(90)),
+        types.Stat("nstops_p99", "Route stops (p99)", stops.percentile(99)),
+        types.Stat("length_max", "Route length (max)", lengths.max),
+        types.Stat("length_min", "Route length (min)", lengths.min),
+        types.Stat("length_avg", "Route length (avg)", lengths.avg),
+        types.Stat("length_total", "Route length (total)", lengths.total),
+        types.Stat("length_p50", "Route length (p50)", lengths.percentile(50)),
+        types.Stat("length_p90", "Route length (p90)", lengths.percentile(90)),
+        types.Stat("length_p99", "Route length (p99)", lengths.percentile(99)),
+        types.Stat("diameter_max", "Route diameter (max)", diameters.max),
+        types.Stat("diameter_min", "Route diameter (min)", diameters.min),
+        types.Stat("diameter_avg", "Route diameter (avg)", diameters.avg),
+        types.Stat("nunassigned", "Unassigned stops", len(unassigned.coords)),
     ]
 
     if all((r.leg_distances is not None) for r in routes):
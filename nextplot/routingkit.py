@@ -86,6 +86,18 @@ def query_routes(
         route.leg_distances = None
         route.leg_durations = None
 
+    # Determine straight line costs (no path found or not moving) and
+    # start/end snapping costs (path found) for all queries in one batch
+    starts, firsts, lasts, ends = [], [], [], []
+    for path, (start, end) in zip(paths, queries, strict=True):
+        direct = len(path) <= 0 or types.Position.equal(start, end)
+        starts.append(start)
+        firsts.append(end if direct else path[0])
+        lasts.append(end if direct else path[-1])
+        ends.append(end)
+    start_costs = common.haversine_distances(common.position_coords(starts), common.position_coords(firsts)).tolist()
+    end_costs = common.haversine_distances(common.position_coords(lasts), common.position_coords(ends)).tolist()
+
     # Add results to routes
     for i, path in enumerate(paths):
         cost = costs[i]
@@ -101,17 +113,17 @@ def query_routes(
             # Path: start -> end
             leg = [start, end]
             # Costs: simply assume straight line
-            cost = common.haversine(start, end)
+            cost = start_costs[i]
             if not distance:
                 cost /= travel_speed
         else:
             # Path: start -> rk path ... -> end
             leg = [start, *path, end]
             # Costs: account for start/end snapping in costs
-            start_cost = common.haversine(start, path[0])
+            start_cost = start_costs[i]
             if not distance:
                 start_cost /= travel_speed
-            end_cost = common.haversine(path[-1], end)
+            end_cost = end_costs[i]
             if not distance:
                 end_cost /= travel_speed
             cost += start_cost + end_cost
@@ -1,7 +1,7 @@
 import json
 import sys
 
-import jsonpath_ng
+from . import common
 
 # ==================== This file contains testing code (mode: 'test')
 
@@ -57,7 +57,7 @@ def test_filter(
         content = "".join(sys.stdin.readlines())
     data = json.loads(content)
     try:
-        expression = jsonpath_ng.parse(jpath)
+        expression = common.parse_jpath(jpath)
     except Exception:
         print(f'error in path syntax: "{jpath}"')
         return
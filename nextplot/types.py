@@ -1,5 +1,8 @@
 import dataclasses
 import enum
+import json
+
+import numpy as np
 
 
 class ColorProfile(enum.Enum):
@@ -22,6 +25,16 @@ class Stat:
         self.val = stat
 
 
+@dataclasses.dataclass(frozen=True)
+class Color:
+    """
+    Represents a color by its RGB values (0-255) and hex string.
+    """
+
+    rgb: tuple[float, float, float]
+    hex: str
+
+
 @dataclasses.dataclass
 class BoundingBox:
     """
@@ -47,6 +60,7 @@ class Position:
     lat: float
     desc: str
     distance: float = 0
+    raw: object = dataclasses.field(default=None, repr=False, compare=False)
 
     def __getitem__(self, key):
         if key == 0:
@@ -66,47 +80,222 @@ class Position:
         """
         return p1.lon == p2.lon and p1.lat == p2.lat
 
+    def description(self) -> str:
+        """
+        Returns the description of this position. If no explicit description
+        is given, it is serialized from the raw JSON data on demand.
+        """
+        if self.desc is None:
+            if self.raw is None:
+                return ""
+            return json.dumps(self.raw, indent=2, sort_keys=True)
+        return self.desc
+
     def clone(self):
         """
         Creates a clone of this position.
         """
-        return Position(self.lon, self.lat, self.desc, self.distance)
+        return Position(self.lon, self.lat, self.desc, self.distance, self.raw)
 
 
-class Point:
+class PositionArray:
     """
-    Defines one point and is used to append additional info to it.
+    Columnar storage for groups of positions (as in routes, clusters, points).
+    The coordinates of all groups are stored in a single (n, 2) array of
+    lon/lat values; group i spans the rows offsets[i] to offsets[i+1].
+    The raw JSON values (used for descriptions) are kept in a side table.
+    """
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray, descs: list = None):
+        self.coords = coords
+        self.offsets = offsets
+        self.descs = descs
+        self._bounds = None
+
+    @staticmethod
+    def empty(dtype=np.float64):
+        """
+        Creates an array without any groups.
+        """
+        return PositionArray(np.empty((0, 2), dtype=dtype), np.zeros(1, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def sizes(self) -> np.ndarray:
+        """
+        Returns the number of points of all groups.
+        """
+        return np.diff(self.offsets)
+
+    def swap(self):
+        """
+        Swaps lon and lat of all positions (without copying the coordinates).
+        """
+        self.coords = self.coords[:, ::-1]
+        self._bounds = None
+
+    def bounds(self) -> np.ndarray:
+        """
+        Returns the bounds (min_x, max_x, min_y, max_y) of all groups as a (g, 4)
+        array (NaN for empty groups). The bounds are calculated once and cached.
+        """
+        if self._bounds is None:
+            bounds = np.full((len(self), 4), np.nan)
+            filled = self.sizes() > 0
+            if filled.any():
+                starts = self.offsets[:-1][filled]
+                mins = np.minimum.reduceat(self.coords, starts, axis=0)
+                maxs = np.maximum.reduceat(self.coords, starts, axis=0)
+                bounds[filled] = np.column_stack([mins[:, 0], maxs[:, 0], mins[:, 1], maxs[:, 1]])
+            self._bounds = bounds
+        return self._bounds
+
+    def group(self, index: int) -> np.ndarray:
+        """
+        Returns a (zero-copy) view of the coordinates of the given group.
+        """
+        return self.coords[self.offsets[index] : self.offsets[index + 1]]
+
+    def positions(self, index: int) -> list[Position]:
+        """
+        Creates position objects for all points of the given group.
+        """
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        descs = self.descs[start:stop] if self.descs is not None else [None] * (stop - start)
+        coords = self.coords[start:stop]
+        if coords.dtype != np.float64:
+            # Use shortest representation of reduced precision values (2.35 instead of 2.3499999)
+            coords = coords.astype(str).astype(np.float64)
+        coords = coords.tolist()
+        return [Position(x, y, None, raw=raw) for (x, y), raw in zip(coords, descs, strict=True)]
+
+    def wrap(self, cls) -> list:
+        """
+        Wraps all groups in the given group type (e.g., Route, Cluster, Point).
+        """
+        return [cls(source=self, index=i) for i in range(len(self))]
+
+
+class PositionGroup:
     """
+    Base for groups of positions. The positions are either given as a list
+    of Position objects or are backed by a group of a PositionArray. In the
+    latter case, the Position objects are only created when accessed.
+    """
+
+    def __init__(self, points: list[Position] = None, source: PositionArray = None, index: int = 0):
+        self._points = points
+        self._source = source
+        self._index = index
 
-    def __init__(self, points):
-        self.points = points
+    @property
+    def points(self) -> list[Position]:
+        if self._points is None:
+            self._points = self._create_points()
+        return self._points
+
+    @points.setter
+    def points(self, points: list[Position]):
+        self._points = points
+        self._source = None
+
+    def _create_points(self) -> list[Position]:
+        """
+        Creates the Position objects of the group from the backing PositionArray.
+        """
+        return self._source.positions(self._index) if self._source is not None else []
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        Returns the coordinates of the group as an (n, 2) array. If the group
+        is backed by a PositionArray, this is a view of it.
+        """
+        if self._source is not None:
+            return self._source.group(self._index)
+        return np.array([(p.lon, p.lat) for p in self.points], dtype=np.float64).reshape(-1, 2)
+
+    @staticmethod
+    def stack_coords(groups: list) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the coordinates of the given groups as one (n, 2) array along with the
+        number of points per group. If the groups are exactly the groups of one
+        PositionArray (in order), its coordinates are returned without copying.
+        """
+        source = groups[0]._source if len(groups) > 0 else None
+        if (
+            source is not None
+            and len(groups) == len(source)
+            and all(g._source is source and g._index == i for i, g in enumerate(groups))
+        ):
+            return source.coords, source.sizes()
+        coords = [g.coords for g in groups]
+        sizes = np.array([len(c) for c in coords], dtype=np.int64)
+        return np.concatenate([*coords, np.empty((0, 2))]), sizes
+
+    def bounds(self) -> np.ndarray:
+        """
+        Returns the bounds (min_x, max_x, min_y, max_y) of the group as a (1, 4)
+        array (NaN if empty). Uses the cached bounds of the PositionArray, if backed by one.
+        """
+        if self._source is not None:
+            return self._source.bounds()[self._index : self._index + 1]
+        coords = self.coords
+        if len(coords) <= 0:
+            return np.full((1, 4), np.nan)
+        (min_x, min_y), (max_x, max_y) = coords.min(axis=0), coords.max(axis=0)
+        return np.array([[min_x, max_x, min_y, max_y]])
+
+
+class Point(PositionGroup):
+    """
+    Defines one point and is used to append additional info to it.
+    """
 
     def __str__(self):
         return ",".join(self.point[0]) if len(self.point) > 0 else "empty"
 
 
-class Cluster:
+class Cluster(PositionGroup):
     """
     Defines one cluster and is used to append additional info to it.
     """
 
-    def __init__(self, cluster):
-        self.points = cluster
-
     def __str__(self):
-        return f"len: {len(self.points)}"
+        return f"len: {len(self.coords)}"
 
 
-class Route:
+class Route(PositionGroup):
     """
     Defines one route and is used to append additional info for it.
     """
 
-    def __init__(self, points: list[Position]):
-        self.points = points
+    def __init__(self, points: list[Position] = None, source: PositionArray = None, index: int = 0):
+        super().__init__(points, source, index)
         self.legs = None
         self.leg_distances = None
         self.leg_durations = None
+        self.distances = None
+        self.length = 0
+
+    def _create_points(self) -> list[Position]:
+        points = super()._create_points()
+        if self.distances is not None:
+            for p, d in zip(points, self.distances.tolist(), strict=True):
+                p.distance = d
+        return points
+
+    def set_distances(self, distances: np.ndarray):
+        """
+        Sets the cumulative distances of all points of the route (applied to
+        the Position objects, once they are created).
+        """
+        self.distances = distances
+        self.length = float(distances[-1]) if len(distances) > 0 else 0
+        if self._points is not None:
+            for p, d in zip(self._points, distances.tolist(), strict=True):
+                p.distance = d
 
     def to_points(self, omit_start: bool, omit_end: bool) -> list[Position]:
         """
@@ -134,8 +323,26 @@ class Route:
                 line.append(self.points[i])
         return line
 
+    def to_coords(self, omit_start: bool, omit_end: bool) -> np.ndarray:
+        """
+        Returns the coordinates of all points of the route.
+        """
+        coords = self.coords
+        start = 1 if omit_start else 0
+        stop = len(coords) - 1 if omit_end else len(coords)
+        return coords[start : max(start, stop)]
+
+    def to_polyline_coords(self, omit_start: bool, omit_end: bool) -> np.ndarray:
+        """
+        Returns the coordinates of the full polyline that can be used for plotting.
+        """
+        if self.legs is None:
+            return self.to_coords(omit_start, omit_end)
+        line = self.to_polyline(omit_start, omit_end)
+        return np.array([(p.lon, p.lat) for p in line], dtype=np.float64).reshape(-1, 2)
+
     def __str__(self):
-        return f"len: {len(self.points)}"
+        return f"len: {len(self.coords)}"
 
 
 class RouteDirectionIndicator(enum.Enum):
@@ -149,3 +356,27 @@ class RouteDirectionIndicator(enum.Enum):
 
     def __str__(self):
         return self.value
+
+
+class PlotRenderer(enum.Enum):
+    """
+    Distinguishes the different renderers of the interactive plots.
+    """
+
+    svg = "svg"
+    webgl = "webgl"
+
+    def __str__(self):
+        return self.value
+
+
+class ImageBackend(enum.Enum):
+    """
+    Distinguishes the different backends for writing plot images.
+    """
+
+    kaleido = "kaleido"
+    raster = "raster"
+
+    def __str__(self):
+        return self.value